@@ -0,0 +1,125 @@
+"""
+Created by: Ori Halevi
+GitHub: https://github.com/ori-halevi
+Python 3.12
+
+Description: Runs a function on a single long-lived thread, merging requests that arrive while it is busy.
+
+Every event that may change the taskbar color (a language switch, a foreground change, CapsLock, a schedule
+boundary...) asks for a sync. Requests made while a sync is running, or waiting to run, are merged into one
+follow-up run with the latest argument, so a burst of events causes one decision and at most one repaint, and no
+thread is started per event.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+
+# Condition to toggle to see DEBUG logging
+DEBUG = False
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG if DEBUG else None,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class CoalescingWorker:
+    """
+    Calls ``function(argument)`` on its own thread for the latest request, merging requests that arrive while
+    it is busy.
+    """
+
+    def __init__(self, function: callable, name: str = "coalescing-worker"):
+        """
+        Args:
+            function (callable): The function to run. Called with the argument of the latest request.
+            name (str): The name of the worker thread.
+        """
+        self.function = function
+        self.name = name
+        self.requests = 0
+        self.runs = 0
+        self._argument = None
+        self._pending = False
+        self._running = False
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self) -> None:
+        """
+        Starts the worker thread.
+        """
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def request(self, argument=None) -> None:
+        """
+        Asks for a run. Returns immediately.
+
+        Args:
+            argument: The argument for the function. The latest request's argument wins.
+        """
+        with self._condition:
+            self.requests += 1
+            self._argument = argument
+            self._pending = True
+            self._condition.notify_all()
+
+    def wait_until_idle(self, timeout: float | None = None) -> bool:
+        """
+        Waits until all the requests made so far were handled.
+
+        Args:
+            timeout (float | None): The longest time to wait, in seconds.
+
+        Returns:
+            bool: True if the worker is idle, False if the timeout passed first.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._running, timeout)
+
+    def stop(self) -> None:
+        """
+        Stops the worker thread after the current run.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._stopped)
+                if self._stopped:
+                    return
+                argument = self._argument
+                self._argument = None
+                self._pending = False
+                self._running = True
+
+            try:
+                self.function(argument)
+            except Exception as e:
+                logging.error(f"Error in {self.name}: {e}")
+            finally:
+                with self._condition:
+                    self.runs += 1
+                    self._running = False
+                    self._condition.notify_all()
+
+
+if __name__ == "__main__":
+    import time
+
+    def slow_sync(argument):
+        print(f"sync {argument}")
+        time.sleep(0.1)
+
+    worker = CoalescingWorker(slow_sync)
+    worker.start()
+    for i in range(20):
+        worker.request(i)
+        time.sleep(0.01)
+    worker.wait_until_idle()
+    print(f"{worker.requests} requests, {worker.runs} runs")
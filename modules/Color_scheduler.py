@@ -0,0 +1,314 @@
+"""
+Created by: Ori Halevi
+GitHub: https://github.com/ori-halevi
+Python 3.12
+
+Description: Time-of-day color schedules, layered on top of the per-language color.
+
+Schedules are kept in the preferences file under "schedules", for example:
+
+    "schedules": [
+        {"name": "After hours", "start": "18:00", "end": "08:00", "accent_color": "#5A6470"},
+        {"name": "Presentations", "start": "10:00", "end": "11:30", "days": ["mon", "wed"],
+         "color_prevalence": 1, "accent_color": "#FFFF00"}
+    ]
+
+"start" and "end" are local times; a schedule whose end is earlier than its start runs past midnight. "days" (the
+days the schedule starts on) defaults to every day. While a schedule is active, "color_prevalence" (0 or 1)
+replaces the per-language decision and "accent_color" replaces the language's accent color. If several schedules
+are active, the first one in the list wins.
+
+A single scheduler thread sleeps until the next start or end of any schedule, and then asks for a sync through the
+same decision path as language changes. It also wakes up at least every ``MAX_SLEEP_SECONDS``, and at once when
+``reschedule`` is called, to read the schedules again (so schedules added to the preferences file by hand are picked
+up). Every time it wakes up it compares the active schedule with the one it saw last, and asks for a sync only if it
+changed - so a schedule that is already running when it is added is applied right away, and a wake-up that changes
+nothing costs no sync.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+# Condition to toggle to see DEBUG logging
+DEBUG = False
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG if DEBUG else None,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Names of the days, as used in the "days" field (Monday first, like datetime.weekday())
+DAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+# Longest single sleep, in seconds. The wall clock can jump (daylight saving time, manual changes) while the sleep
+# is measured in real time, and the schedules can be edited, so the next boundary is computed again at least this
+# often. Nothing is applied unless a boundary was crossed.
+MAX_SLEEP_SECONDS = 60 * 60
+
+
+def _parse_time(text: str) -> int:
+    """
+    Returns the minute of the day of an "HH:MM" time.
+    """
+    hours, minutes = (int(part) for part in text.split(":"))
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid time: {text}")
+    return hours * 60 + minutes
+
+
+def _parse_color(text: str) -> tuple[int, int, int]:
+    """
+    Returns the RGB values of a "#RRGGBB" color.
+    """
+    text = text.lstrip("#")
+    if len(text) != 6:
+        raise ValueError(f"Invalid color: {text}")
+    return int(text[0:2], 16), int(text[2:4], 16), int(text[4:6], 16)
+
+
+def parse_schedules(raw_schedules: list) -> list[dict]:
+    """
+    Validates the schedules from the preferences file. Invalid schedules are logged and skipped.
+
+    Args:
+        raw_schedules (list): The "schedules" setting.
+
+    Returns:
+        list[dict]: The valid schedules, with "start" and "end" as minutes of the day, "days" as a set of weekday
+        numbers and "accent_color" as an RGB tuple.
+    """
+    schedules = []
+    for raw in raw_schedules or []:
+        try:
+            days = raw.get("days") or DAY_NAMES
+            color_prevalence = raw.get("color_prevalence")
+            schedules.append({
+                "name": raw.get("name", f"{raw['start']}-{raw['end']}"),
+                "start": _parse_time(raw["start"]),
+                "end": _parse_time(raw["end"]),
+                "days": {DAY_NAMES.index(day.lower()[:3]) for day in days},
+                "color_prevalence": None if color_prevalence is None else int(bool(color_prevalence)),
+                "accent_color": _parse_color(raw["accent_color"]) if raw.get("accent_color") else None,
+            })
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            logging.error(f"Skipping invalid schedule {raw}: {e}")
+    return schedules
+
+
+def _occurrences(schedule: dict, now: datetime):
+    """
+    Yields the (start, end) times of a schedule's runs that start between yesterday and a week from now.
+    """
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    length = (schedule["end"] - schedule["start"]) % (24 * 60) or 24 * 60  # Equal start and end: the whole day
+    for day_offset in range(-1, 8):
+        day = today + timedelta(days=day_offset)
+        if day.weekday() in schedule["days"]:
+            start = day + timedelta(minutes=schedule["start"])
+            yield start, start + timedelta(minutes=length)
+
+
+def get_active_schedule(schedules: list[dict], now: datetime) -> dict | None:
+    """
+    Returns the schedule that is active at the given time.
+
+    Args:
+        schedules (list[dict]): Schedules returned by ``parse_schedules``.
+        now (datetime): The local time.
+
+    Returns:
+        dict | None: The first active schedule, or None if none is active.
+    """
+    for schedule in schedules:
+        if any(start <= now < end for start, end in _occurrences(schedule, now)):
+            return schedule
+    return None
+
+
+def get_next_boundary(schedules: list[dict], now: datetime) -> datetime | None:
+    """
+    Returns the next time any schedule starts or ends.
+
+    Args:
+        schedules (list[dict]): Schedules returned by ``parse_schedules``.
+        now (datetime): The local time.
+
+    Returns:
+        datetime | None: The next boundary after ``now``, or None if there are no schedules.
+    """
+    boundaries = [
+        boundary
+        for schedule in schedules
+        for occurrence in _occurrences(schedule, now)
+        for boundary in occurrence
+        if boundary > now
+    ]
+    return min(boundaries, default=None)
+
+
+class SystemClock:
+    """
+    The real clock. Tests can pass a clock with the same two methods instead.
+    """
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def wait(self, event: threading.Event, seconds: float | None) -> bool:
+        """
+        Sleeps for the given time, or until the event is set. Returns True if the event was set.
+        """
+        return event.wait(seconds)
+
+
+class ColorScheduler:
+    """
+    Sleeps until the next schedule boundary and then calls ``on_boundary``.
+    """
+
+    def __init__(self, schedules_query: callable, on_boundary: callable, clock=None):
+        """
+        Args:
+            schedules_query (callable): Returns the current schedules (as returned by ``parse_schedules``).
+            on_boundary (callable): Called when a schedule starts or ends.
+            clock: Provides ``now()`` and ``wait(event, seconds)``. Defaults to the system clock.
+        """
+        self.schedules_query = schedules_query
+        self.on_boundary = on_boundary
+        self.clock = clock or SystemClock()
+        self.next_boundary = None
+        self.active_schedule = None
+        self._wake_event = threading.Event()
+        self._stop_event = None
+
+    def reschedule(self) -> None:
+        """
+        Wakes the scheduler up to compute the next boundary again (e.g. after the schedules were edited).
+        """
+        self._wake_event.set()
+
+    def run(self, stop_event: threading.Event) -> None:
+        """
+        Runs until the stop event is set.
+
+        Args:
+            stop_event (threading.Event): When set (followed by ``reschedule``), the scheduler stops.
+        """
+        self._stop_event = stop_event
+        # The schedule active at the start was already applied by the first sync, so only changes call on_boundary
+        self.active_schedule = get_active_schedule(self.schedules_query(), self.clock.now())
+        while not stop_event.is_set():
+            self._wake_event.clear()
+            now = self.clock.now()
+            schedules = self.schedules_query()
+
+            active_schedule = get_active_schedule(schedules, now)
+            if active_schedule != self.active_schedule:
+                # A boundary was crossed, or the schedules were edited (or the wall clock jumped) while one runs
+                logging.info(f"Active schedule at {now:%H:%M}: {active_schedule['name'] if active_schedule else None}")
+                self.active_schedule = active_schedule
+                self.on_boundary()
+
+            self.next_boundary = get_next_boundary(schedules, now)
+            if self.next_boundary is None:
+                # No schedules: check again later, or when they are edited
+                self.clock.wait(self._wake_event, MAX_SLEEP_SECONDS)
+                continue
+
+            # Woken up by the boundary, the time limit or reschedule(): either way, the loop checks again
+            seconds = min((self.next_boundary - now).total_seconds(), MAX_SLEEP_SECONDS)
+            self.clock.wait(self._wake_event, max(seconds, 0))
+
+    def stop(self) -> None:
+        """
+        Stops the scheduler.
+        """
+        if self._stop_event is not None:
+            self._stop_event.set()
+        self._wake_event.set()
+
+
+if __name__ == "__main__":
+
+    class FakeClock:
+        """
+        A clock that jumps forward instead of sleeping.
+        """
+
+        def __init__(self, start: datetime, end: datetime):
+            self.current = start
+            self.end = end
+            self.sleeps = []
+
+        def now(self) -> datetime:
+            return self.current
+
+        def wait(self, event, seconds):
+            if seconds is None or self.current + timedelta(seconds=seconds) > self.end:
+                scheduler.stop()  # The simulated time is over
+                return True
+            self.sleeps.append(seconds)
+            self.current += timedelta(seconds=seconds)
+            return False
+
+    example_schedules = parse_schedules([
+        {"name": "After hours", "start": "18:00", "end": "08:00", "accent_color": "#5A6470"},
+        {"name": "Presentations", "start": "10:00", "end": "11:30", "days": ["mon", "wed"], "color_prevalence": 1},
+    ])
+
+    # Monday 2024-09-02, simulated for two days
+    fake_clock = FakeClock(datetime(2024, 9, 2, 7, 0), datetime(2024, 9, 4, 7, 0))
+    boundaries = []
+
+    def on_example_boundary():
+        active = get_active_schedule(scheduler.schedules_query(), fake_clock.now())
+        boundaries.append(f"{fake_clock.now():%a %H:%M} -> {active['name'] if active else 'no schedule'}")
+
+    scheduler = ColorScheduler(lambda: example_schedules, on_example_boundary, fake_clock)
+    scheduler.run(threading.Event())
+
+    print("\n".join(boundaries))
+    print(f"{len(fake_clock.sleeps)} sleeps for {len(boundaries)} boundaries")
+    assert boundaries == [
+        "Mon 08:00 -> no schedule",
+        "Mon 10:00 -> Presentations",
+        "Mon 11:30 -> no schedule",
+        "Mon 18:00 -> After hours",
+        "Tue 08:00 -> no schedule",
+        "Tue 18:00 -> After hours",
+    ], boundaries
+
+    # Schedules added after the start (e.g. by editing the preferences file) are picked up without a restart
+    fake_clock = FakeClock(datetime(2024, 9, 2, 7, 0), datetime(2024, 9, 2, 12, 0))
+    boundaries = []
+
+    def get_schedules_added_at_nine():
+        return example_schedules if fake_clock.now() >= datetime(2024, 9, 2, 9, 0) else []
+
+    scheduler = ColorScheduler(get_schedules_added_at_nine, on_example_boundary, fake_clock)
+    scheduler.run(threading.Event())
+    assert boundaries == ["Mon 10:00 -> Presentations", "Mon 11:30 -> no schedule"], boundaries
+
+    # A schedule that is already running when it is added is applied at once, not at its next boundary
+    fake_clock = FakeClock(datetime(2024, 9, 2, 6, 30), datetime(2024, 9, 2, 9, 0))
+    boundaries = []
+
+    def get_schedules_added_at_seven_thirty():
+        return example_schedules if fake_clock.now() >= datetime(2024, 9, 2, 7, 30) else []
+
+    scheduler = ColorScheduler(get_schedules_added_at_seven_thirty, on_example_boundary, fake_clock)
+    scheduler.run(threading.Event())
+    assert boundaries == ["Mon 07:30 -> After hours", "Mon 08:00 -> no schedule"], boundaries
+
+    # Removing the running schedule undoes it at the next wake-up (at most MAX_SLEEP_SECONDS later)
+    fake_clock = FakeClock(datetime(2024, 9, 2, 9, 0), datetime(2024, 9, 2, 12, 0))
+    boundaries = []
+
+    def get_schedules_removed_at_ten_thirty():
+        return example_schedules if fake_clock.now() < datetime(2024, 9, 2, 10, 30) else []
+
+    scheduler = ColorScheduler(get_schedules_removed_at_ten_thirty, on_example_boundary, fake_clock)
+    scheduler.run(threading.Event())
+    assert boundaries == ["Mon 10:00 -> Presentations", "Mon 11:00 -> no schedule"], boundaries
+    print("OK")
@@ -0,0 +1,316 @@
+"""
+Created by: Ori Halevi
+GitHub: https://github.com/ori-halevi
+Python 3.12
+
+Description: Windows keeps the keyboard layout per thread, so moving the focus to a window whose thread uses
+another layout changes the active language without writing to "SOFTWARE/Microsoft/Input/Locales", and the
+registry monitor never hears about it.
+
+This module listens for foreground window changes (a WinEvent hook for EVENT_SYSTEM_FOREGROUND) and reports the
+layout of the new foreground window. It keeps a cache of window -> thread and thread -> layout, so switching
+between windows whose layout is already known costs no Win32 queries at all. Unless "different input method for
+each app window" is turned on, a language switch changes the layout of every thread, so all the cached layouts
+are dropped whenever the registry monitor reports a switch.
+
+The event source and the Win32 queries can be replaced, so the monitor can be driven by fake events in tests.
+"""
+from __future__ import annotations
+
+import ctypes
+import logging
+import threading
+from ctypes import wintypes
+from modules.Resource_accounting import track_open, track_close
+
+# Debugging flag
+DEBUG = False
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG if DEBUG else None,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Constants for the WinEvent hook and the message loop
+EVENT_SYSTEM_FOREGROUND = 0x0003  # The foreground window has changed
+WINEVENT_OUTOFCONTEXT = 0x0000  # The callback runs in our own process
+WINEVENT_SKIPOWNPROCESS = 0x0002  # Don't report our own windows (e.g. the tray menu)
+QS_ALLINPUT = 0x04FF  # Wake up on any kind of message
+PM_REMOVE = 0x0001  # Remove the message from the queue while peeking
+
+# Cached windows are dropped when the cache grows past this size (window handles are reused by Windows)
+MAX_CACHED_WINDOWS = 512
+
+# Cached thread layouts are dropped when the cache grows past this size (thread IDs are reused too)
+MAX_CACHED_THREADS = 256
+
+# Type of the WinEvent callback (CFUNCTYPE only so the module can be imported and faked outside of Windows)
+WinEventProcType = getattr(ctypes, 'WINFUNCTYPE', ctypes.CFUNCTYPE)(
+    None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND, wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+
+_user32 = None
+
+
+def _get_user32():
+    """
+    Loads user32.dll on first use, so the module can be imported (and faked) where it is not available.
+    """
+    global _user32
+    if _user32 is None:
+        _user32 = ctypes.WinDLL('user32')
+
+        _user32.SetWinEventHook.argtypes = [wintypes.DWORD, wintypes.DWORD, wintypes.HMODULE, WinEventProcType,
+                                            wintypes.DWORD, wintypes.DWORD, wintypes.DWORD]
+        _user32.SetWinEventHook.restype = wintypes.HANDLE
+        _user32.UnhookWinEvent.argtypes = [wintypes.HANDLE]
+        _user32.GetWindowThreadProcessId.argtypes = [wintypes.HWND, ctypes.c_void_p]
+        _user32.GetWindowThreadProcessId.restype = wintypes.DWORD
+        _user32.GetKeyboardLayout.argtypes = [wintypes.DWORD]
+        _user32.GetKeyboardLayout.restype = ctypes.c_void_p
+        _user32.GetForegroundWindow.restype = wintypes.HWND
+    return _user32
+
+
+def query_window_thread(hwnd: int) -> int:
+    """
+    Returns the ID of the thread that created the given window.
+    """
+    return _get_user32().GetWindowThreadProcessId(hwnd, None)
+
+
+def query_thread_layout(thread_id: int) -> int:
+    """
+    Returns the keyboard layout handle (HKL) that the given thread uses.
+    """
+    return (_get_user32().GetKeyboardLayout(thread_id) or 0) & 0xFFFFFFFF
+
+
+def query_foreground_window() -> int | None:
+    """
+    Returns the handle of the current foreground window.
+    """
+    return _get_user32().GetForegroundWindow()
+
+
+def win_event_foreground_source(callback: callable, stop_event: threading.Event) -> None:
+    """
+    Calls ``callback(hwnd)`` every time the foreground window changes, until the stop event is set.
+    Runs a message loop on the calling thread, as required by out-of-context WinEvent hooks.
+
+    Args:
+        callback (callable): The function to call with the handle of the new foreground window.
+        stop_event (threading.Event): When set, the hook is removed and the function returns.
+    """
+    user32 = _get_user32()
+
+    def win_event_proc(_hook, _event, hwnd, _id_object, _id_child, _thread, _time):
+        if hwnd:
+            try:
+                callback(hwnd)
+            except Exception as e:
+                logging.error(f"Error handling foreground change: {e}")
+
+    # Keep a reference to the callback object for as long as the hook exists
+    proc = WinEventProcType(win_event_proc)
+    hook = user32.SetWinEventHook(EVENT_SYSTEM_FOREGROUND, EVENT_SYSTEM_FOREGROUND, None, proc, 0, 0,
+                                  WINEVENT_OUTOFCONTEXT | WINEVENT_SKIPOWNPROCESS)
+    if not hook:
+        logging.error("Error setting up the foreground change hook.")
+        return
+    track_open("win_event_hook", "Foreground_change_monitor.win_event_foreground_source")
+
+    try:
+        msg = wintypes.MSG()
+        while not stop_event.is_set():
+            # Sleep until a message arrives, waking up twice a second to check the stop event
+            user32.MsgWaitForMultipleObjects(0, None, False, 500, QS_ALLINPUT)
+            while user32.PeekMessageW(ctypes.byref(msg), None, 0, 0, PM_REMOVE):
+                user32.TranslateMessage(ctypes.byref(msg))
+                user32.DispatchMessageW(ctypes.byref(msg))
+    finally:
+        user32.UnhookWinEvent(hook)
+        track_close("win_event_hook", "Foreground_change_monitor.win_event_foreground_source")
+
+
+class ThreadLayoutCache:
+    """
+    Remembers which thread owns each window and which keyboard layout each thread uses.
+    """
+
+    def __init__(self, max_windows: int = MAX_CACHED_WINDOWS, max_threads: int = MAX_CACHED_THREADS):
+        self.max_windows = max_windows
+        self.max_threads = max_threads
+        self._window_threads: dict[int, int] = {}
+        self._thread_layouts: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_thread(self, hwnd: int) -> int | None:
+        with self._lock:
+            return self._window_threads.get(hwnd)
+
+    def get_layout(self, thread_id: int) -> int | None:
+        with self._lock:
+            layout = self._thread_layouts.get(thread_id)
+            if layout is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return layout
+
+    def store(self, hwnd: int, thread_id: int, layout: int) -> None:
+        with self._lock:
+            if len(self._window_threads) >= self.max_windows and hwnd not in self._window_threads:
+                self._window_threads.clear()
+            self._window_threads[hwnd] = thread_id
+            if len(self._thread_layouts) >= self.max_threads and thread_id not in self._thread_layouts:
+                self._thread_layouts.clear()
+            self._thread_layouts[thread_id] = layout
+
+    def invalidate_layouts(self) -> None:
+        """
+        Drops the layouts of all the threads (the windows' threads are kept).
+        """
+        with self._lock:
+            self._thread_layouts.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._window_threads.clear()
+            self._thread_layouts.clear()
+
+
+class ForegroundChangeMonitor:
+    """
+    Reports the keyboard layout of the foreground window whenever it changes.
+    """
+
+    def __init__(self, on_layout_change: callable, event_source: callable = win_event_foreground_source,
+                 window_thread_query: callable = query_window_thread,
+                 thread_layout_query: callable = query_thread_layout,
+                 foreground_window_query: callable = query_foreground_window):
+        """
+        Args:
+            on_layout_change (callable): Called as ``on_layout_change(layout)`` when the active layout changes.
+            event_source (callable): Called as ``event_source(callback, stop_event)``; must call ``callback(hwnd)``
+                for every foreground change until the stop event is set.
+            window_thread_query (callable): Returns the thread ID of a window.
+            thread_layout_query (callable): Returns the keyboard layout of a thread.
+            foreground_window_query (callable): Returns the current foreground window.
+        """
+        self.on_layout_change = on_layout_change
+        self.event_source = event_source
+        self.window_thread_query = window_thread_query
+        self.thread_layout_query = thread_layout_query
+        self.foreground_window_query = foreground_window_query
+        self.cache = ThreadLayoutCache()
+        self.current_hwnd = None
+        self.current_thread_id = None
+        self.current_layout = None
+        self._lock = threading.Lock()
+
+    def _resolve(self, hwnd: int) -> tuple[int, int]:
+        """
+        Returns the thread and layout of a window, from the cache when possible.
+        """
+        thread_id = self.cache.get_thread(hwnd)
+        if thread_id is None:
+            thread_id = self.window_thread_query(hwnd)
+        layout = self.cache.get_layout(thread_id)
+        if layout is None:
+            layout = self.thread_layout_query(thread_id)
+        self.cache.store(hwnd, thread_id, layout)
+        return thread_id, layout
+
+    def handle_foreground_change(self, hwnd: int) -> None:
+        """
+        Handles a foreground change and calls ``on_layout_change`` if the active layout changed.
+
+        Args:
+            hwnd (int): The handle of the new foreground window.
+        """
+        with self._lock:
+            thread_id, layout = self._resolve(hwnd)
+            self.current_hwnd = hwnd
+            self.current_thread_id = thread_id
+            changed = layout != self.current_layout
+            self.current_layout = layout
+
+        if changed:
+            logging.debug(f"Foreground layout changed to {layout:#x}")
+            self.on_layout_change(layout)
+
+    def refresh(self) -> int | None:
+        """
+        Re-reads the layout of the foreground window after the language was switched (e.g. when the registry
+        monitor reports a switch). With the default Windows settings the switch applies to every thread, so the
+        cached layouts of all the threads are dropped, not only the foreground one. Does not call
+        ``on_layout_change``.
+
+        Returns:
+            int | None: The layout of the foreground window, or None if there is no foreground window.
+        """
+        hwnd = self.foreground_window_query()
+        if not hwnd:
+            return None
+        with self._lock:
+            self.cache.invalidate_layouts()
+            thread_id, layout = self._resolve(hwnd)
+            self.current_hwnd = hwnd
+            self.current_thread_id = thread_id
+            self.current_layout = layout
+        return layout
+
+    def run(self, stop_event: threading.Event) -> None:
+        """
+        Listens for foreground changes until the stop event is set.
+
+        Args:
+            stop_event (threading.Event): When set, the monitor stops.
+        """
+        self.event_source(self.handle_foreground_change, stop_event)
+
+
+if __name__ == "__main__":
+
+    # Drive the monitor with fake windows, threads and layouts
+    fake_window_threads = {1: 10, 2: 20, 3: 10}
+    fake_thread_layouts = {10: 0x04090409, 20: 0x040D040D}
+    queries = []
+
+    def fake_window_thread(hwnd):
+        queries.append(("thread", hwnd))
+        return fake_window_threads[hwnd]
+
+    def fake_thread_layout(thread_id):
+        queries.append(("layout", thread_id))
+        return fake_thread_layouts[thread_id]
+
+    def fake_event_source(callback, stop_event):
+        for hwnd in (1, 2, 3, 1, 2, 1):
+            callback(hwnd)
+
+    reported_layouts = []
+
+    def on_example_layout_change(layout):
+        print(f"Layout changed: {layout:#x}")
+        reported_layouts.append(layout)
+
+    monitor = ForegroundChangeMonitor(on_example_layout_change,
+                                      event_source=fake_event_source,
+                                      window_thread_query=fake_window_thread,
+                                      thread_layout_query=fake_thread_layout,
+                                      foreground_window_query=lambda: 1)
+    monitor.run(threading.Event())
+    print(f"Win32 queries: {queries}")
+    assert reported_layouts == [0x04090409, 0x040D040D, 0x04090409, 0x040D040D, 0x04090409]
+
+    # A global switch to Russian in window 1 changes the layout of every thread, so focusing window 2 (another
+    # thread) must not report the layout it had before the switch
+    fake_thread_layouts = {10: 0x04190419, 20: 0x04190419}
+    assert monitor.refresh() == 0x04190419
+    reported_layouts.clear()
+    monitor.handle_foreground_change(2)
+    monitor.handle_foreground_change(3)
+    assert reported_layouts == [], reported_layouts
+    print("OK")
@@ -0,0 +1,347 @@
+"""
+Created by: Ori Halevi
+GitHub: https://github.com/ori-halevi
+Python 3.12
+
+Description: A small registry of extra actions ("hooks") that run after the taskbar color was applied for a
+language change, e.g. recoloring a status LED, notifying an overlay or logging to a local collector.
+
+Hooks are plain callables with the signature ``hook(language, color_prevalence)``. They can be registered in code
+with ``register_hook`` or discovered from installed packages through the entry point group
+"taskbar_color_change_by_lang.hooks".
+
+Hooks never run on the thread that repaints the taskbar. They are dispatched to a small bounded thread pool, every
+hook has its own timeout, and a hook that is still running, keeps failing or keeps timing out is isolated so it
+can't hold up the others. A hook that hangs counts as timing out on every change it misses, and once it is
+quarantined the pool it is stuck in is retired, so hung hooks can't use up the workers of the other hooks.
+Everything that happens is counted and can be read with ``get_hook_metrics``.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib.metadata import entry_points
+
+# Condition to toggle to see DEBUG logging
+DEBUG = False
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG if DEBUG else None,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Entry point group that installed packages can use to provide hooks
+ENTRY_POINT_GROUP = "taskbar_color_change_by_lang.hooks"
+
+# Default time (in seconds) a hook may take before it is reported as timed out
+DEFAULT_HOOK_TIMEOUT = 2.0
+
+# Maximum number of hooks that run at the same time
+MAX_HOOK_WORKERS = 4
+
+# After this many failures/timeouts in a row a hook is quarantined and no longer called
+MAX_CONSECUTIVE_FAILURES = 3
+
+
+class _Hook:
+    """
+    Holds a registered hook together with its state and metrics.
+    """
+
+    def __init__(self, name: str, function: callable, timeout: float):
+        self.name = name
+        self.function = function
+        self.timeout = timeout
+        # State of the current run
+        self.future = None
+        self.running_since = None
+        self.overdue_reported = False
+        self.consecutive_failures = 0
+        self.quarantined = False
+        # Metrics
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_error = None
+
+
+_hooks: dict[str, _Hook] = {}
+_hooks_lock = threading.Lock()
+_executor = None
+_retired_executors = 0
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Creates the bounded thread pool on first use, so no threads exist while no hooks are registered.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_HOOK_WORKERS, thread_name_prefix="language-hook")
+    return _executor
+
+
+def register_hook(name: str, function: callable, timeout: float = DEFAULT_HOOK_TIMEOUT) -> None:
+    """
+    Registers a hook that runs after every language change.
+
+    Args:
+        name (str): A unique name for the hook, used in logs and metrics.
+        function (callable): The hook, called as ``function(language, color_prevalence)``.
+        timeout (float): How long (in seconds) the hook may run before it is reported as timed out.
+    """
+    if not callable(function):
+        raise TypeError(f"Hook '{name}' is not callable.")
+    with _hooks_lock:
+        _hooks[name] = _Hook(name, function, timeout)
+    logging.info(f"Registered language change hook '{name}'.")
+
+
+def unregister_hook(name: str) -> None:
+    """
+    Removes a registered hook. Unknown names are ignored.
+
+    Args:
+        name (str): The name the hook was registered with.
+    """
+    with _hooks_lock:
+        _hooks.pop(name, None)
+
+
+def discover_entry_point_hooks(group: str = ENTRY_POINT_GROUP) -> list[str]:
+    """
+    Loads and registers all hooks that installed packages publish under the given entry point group.
+    A hook object may define a ``timeout`` attribute to override the default timeout.
+
+    Args:
+        group (str): The entry point group to search.
+
+    Returns:
+        list[str]: The names of the hooks that were registered.
+    """
+    registered = []
+    for entry_point in entry_points(group=group):
+        try:
+            function = entry_point.load()
+            register_hook(entry_point.name, function, getattr(function, "timeout", DEFAULT_HOOK_TIMEOUT))
+            registered.append(entry_point.name)
+        except Exception as e:
+            logging.error(f"Error loading language change hook '{entry_point.name}': {e}")
+    return registered
+
+
+def _run_hook(hook: _Hook, language: str | None, color_prevalence: int | None) -> None:
+    """
+    Runs a single hook on a pool thread and records how it went.
+    """
+    start = time.perf_counter()
+    with _hooks_lock:
+        hook.running_since = start  # Time spent waiting in the queue doesn't count
+    error = None
+    try:
+        hook.function(language, color_prevalence)
+    except Exception as e:
+        error = e
+    elapsed = time.perf_counter() - start
+
+    with _hooks_lock:
+        hook.future = None
+        hook.running_since = None
+        hook.total_seconds += elapsed
+        hook.max_seconds = max(hook.max_seconds, elapsed)
+
+        if error is not None:
+            hook.failures += 1
+            hook.last_error = repr(error)
+            logging.error(f"Language change hook '{hook.name}' failed: {error}")
+        elif elapsed > hook.timeout:
+            logging.warning(f"Language change hook '{hook.name}' took {elapsed:.2f}s (timeout {hook.timeout}s).")
+            if hook.overdue_reported:
+                # Already counted while it was running
+                hook.overdue_reported = False
+                return
+            hook.timeouts += 1
+        else:
+            hook.successes += 1
+            hook.consecutive_failures = 0
+            hook.overdue_reported = False
+            return
+
+        hook.overdue_reported = False
+        _count_failure(hook)
+
+
+def _count_failure(hook: _Hook) -> None:
+    """
+    Counts a failure or timeout of a hook in a row, and quarantines the hook when there were too many.
+    Must be called with the hooks lock held.
+    """
+    hook.consecutive_failures += 1
+    if hook.consecutive_failures < MAX_CONSECUTIVE_FAILURES or hook.quarantined:
+        return
+    hook.quarantined = True
+    logging.error(f"Language change hook '{hook.name}' was quarantined after "
+                  f"{hook.consecutive_failures} failures in a row.")
+    if hook.running_since is not None:
+        _retire_executor()
+
+
+def _retire_executor() -> None:
+    """
+    Leaves the current pool to a hung hook and lets the next dispatch create a fresh one, so the other hooks
+    get workers again. Hooks still waiting in the old pool are cancelled and run again on the next change.
+    Must be called with the hooks lock held.
+    """
+    global _executor, _retired_executors
+    if _executor is None:
+        return
+    for hook in _hooks.values():
+        if hook.future is not None and hook.future.cancel():
+            hook.future = None
+            hook.calls -= 1
+    _executor.shutdown(wait=False)
+    _executor = None
+    _retired_executors += 1
+    logging.warning("The language change hook pool was retired because a hung hook was quarantined.")
+
+
+def run_hooks(language: str | None, color_prevalence: int | None) -> None:
+    """
+    Dispatches all registered hooks to the hook thread pool and returns immediately.
+    A hook that is still running from an earlier change, or was quarantined, is skipped. Every change a hook
+    misses because it is running past its timeout counts toward its quarantine.
+
+    Args:
+        language (str | None): The current keyboard language.
+        color_prevalence (int | None): The ColorPrevalence value that was applied.
+    """
+    now = time.perf_counter()
+    to_run = []
+
+    with _hooks_lock:
+        for hook in _hooks.values():
+            if hook.quarantined:
+                hook.skipped += 1
+                continue
+            if hook.future is not None:
+                # Still busy with (or waiting for) an earlier change
+                hook.skipped += 1
+                if hook.running_since is not None and now - hook.running_since > hook.timeout:
+                    if not hook.overdue_reported:
+                        hook.overdue_reported = True
+                        hook.timeouts += 1
+                        logging.warning(f"Language change hook '{hook.name}' is still running after "
+                                        f"{hook.timeout}s.")
+                    # A hook that hangs never finishes, so every change it misses counts as a failure
+                    _count_failure(hook)
+                continue
+            hook.calls += 1
+            to_run.append(hook)
+
+        if to_run:
+            executor = _get_executor()
+            for hook in to_run:
+                hook.future = executor.submit(_run_hook, hook, language, color_prevalence)
+
+
+def get_hook_metrics() -> dict[str, dict]:
+    """
+    Returns the metrics of every registered hook.
+
+    Returns:
+        dict[str, dict]: The metrics of each hook, keyed by the hook name.
+    """
+    now = time.perf_counter()
+    with _hooks_lock:
+        return {
+            hook.name: {
+                "calls": hook.calls,
+                "successes": hook.successes,
+                "failures": hook.failures,
+                "timeouts": hook.timeouts,
+                "skipped": hook.skipped,
+                "quarantined": hook.quarantined,
+                "running_for_seconds": None if hook.running_since is None else now - hook.running_since,
+                "average_seconds": hook.total_seconds / max(hook.calls - (hook.future is not None), 1),
+                "max_seconds": hook.max_seconds,
+                "last_error": hook.last_error,
+            }
+            for hook in _hooks.values()
+        }
+
+
+def reset_hook(name: str) -> None:
+    """
+    Releases a hook from quarantine so it is called again on the next language change.
+
+    Args:
+        name (str): The name the hook was registered with.
+    """
+    with _hooks_lock:
+        hook = _hooks.get(name)
+        if hook is not None:
+            hook.quarantined = False
+            hook.consecutive_failures = 0
+
+
+def shutdown_hooks() -> None:
+    """
+    Stops the hook thread pool without waiting for hooks that are still running.
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+if __name__ == "__main__":
+
+    def fast_hook(language, color_prevalence):
+        print(f"fast hook: {language} {color_prevalence}")
+
+    def slow_hook(language, color_prevalence):
+        time.sleep(1)
+
+    def broken_hook(language, color_prevalence):
+        raise RuntimeError("broken")
+
+    hung_hook_release = threading.Event()
+
+    def hung_hook(language, color_prevalence):
+        hung_hook_release.wait()
+
+    register_hook("fast", fast_hook)
+    register_hook("slow", slow_hook, timeout=0.5)
+    register_hook("broken", broken_hook)
+    for i in range(MAX_HOOK_WORKERS):
+        register_hook(f"hung-{i}", hung_hook, timeout=0.2)
+
+    for _ in range(8):
+        run_hooks("English", 1)
+        time.sleep(0.3)
+    time.sleep(1.5)
+
+    try:
+        metrics = get_hook_metrics()
+        for hook_name, hook_metrics in metrics.items():
+            print(hook_name, hook_metrics)
+
+        # The hung hooks were quarantined, and the pool they were stuck in was retired
+        assert all(metrics[f"hung-{i}"]["quarantined"] for i in range(MAX_HOOK_WORKERS))
+        assert metrics["broken"]["quarantined"]
+        assert not metrics["fast"]["quarantined"]
+        assert _retired_executors >= 1
+
+        # So the fast hook still gets a worker on the next change
+        run_hooks("Hebrew", 0)
+        time.sleep(0.2)
+        assert get_hook_metrics()["fast"]["successes"] == metrics["fast"]["successes"] + 1
+        print("OK")
+    finally:
+        hung_hook_release.set()
+        shutdown_hooks()
@@ -20,6 +20,8 @@ from __future__ import annotations
 import ctypes
 import winreg
 import logging
+from functools import lru_cache
+from modules.Resource_accounting import track_open, track_close
 
 # Debugging flag
 DEBUG = False
@@ -54,11 +56,18 @@ WaitForSingleObject = kernel32.WaitForSingleObject
 WaitForSingleObject.argtypes = [HKEY, DWORD]
 WaitForSingleObject.restype = DWORD
 
+CloseHandle = kernel32.CloseHandle
+CloseHandle.argtypes = [HKEY]
+CloseHandle.restype = ctypes.c_bool
+
 # Function to get the current keyboard layout
 GetKeyboardLayout = user32.GetKeyboardLayout
 GetKeyboardLayout.argtypes = [ctypes.c_ulong]
 GetKeyboardLayout.restype = ctypes.c_ulong
 
+# Creation site of the handles opened by the monitor, for resource accounting
+RESOURCE_SITE = "Language_change_monitor.start_monitor_language_in_registry_key"
+
 # Registry path for input locales
 hkey = winreg.HKEY_LOCAL_MACHINE
 subkey = r"SOFTWARE\WOW6432Node\Microsoft\Input\Locales"
@@ -75,10 +84,32 @@ def get_current_language() -> str | None:
     Returns:
         str | None: The current keyboard layout language as a string, or None if it cannot be retrieved.
     """
+    return get_language_name(get_current_layout() & 0xFFFF)  # The low-order word is the language ID
+
+
+def get_current_layout() -> int:
+    """
+    Returns the keyboard layout (HKL) of the foreground window.
+
+    Returns:
+        int: The keyboard layout handle.
+    """
     hwnd = GetForegroundWindow()
-    layout = GetKeyboardLayout(ctypes.windll.user32.GetWindowThreadProcessId(hwnd, None))
-    language_id = layout & 0xFFFF  # Extract the low-order word (language ID)
+    return GetKeyboardLayout(ctypes.windll.user32.GetWindowThreadProcessId(hwnd, None))
+
+
+@lru_cache(maxsize=None)
+def get_language_name(language_id: int) -> str | None:
+    """
+    Returns the name of the language with the given language ID. The names never change while the app runs,
+    so every language ID is only looked up once.
 
+    Args:
+        language_id (int): The language ID (the low-order word of a keyboard layout handle).
+
+    Returns:
+        str | None: The language name as a string, or None if it cannot be retrieved.
+    """
     buffer = ctypes.create_unicode_buffer(100)
     if ctypes.windll.kernel32.GetLocaleInfoW(language_id, 0x00000002, buffer, len(buffer)):
         return buffer.value
@@ -95,50 +126,57 @@ def start_monitor_language_in_registry_key(duration: int = -1, user_function: ca
     :return: The current keyboard language if a change is detected; False if no change occurred; None in case of error.
     """
     event = None
+    reg_key = None
     try:
-        with winreg.OpenKey(hkey, subkey, 0, KEY_NOTIFY) as reg_key:
-            reg_key_handle = ctypes.c_void_p(reg_key.handle)
-
-            event = CreateEventW(None, True, False, None)
-            if not event:
-                logging.error("Error creating event handle.")
-                return None
-
-            result = RegNotifyChangeKeyValue(
-                reg_key_handle,
-                False,
-                REG_NOTIFY_CHANGE_LAST_SET,
-                event,
-                True
-            )
-
-            if result != 0:
-                logging.error(f"Error setting up registry change notification. Error code: {ctypes.get_last_error()}")
-                return None
-
-            logging.info("Monitoring keyboard language layout changes.")
-
-            wait_result = WaitForSingleObject(event, duration)
-            if wait_result == 0:  # Event occurred
-                logging.info("Registry key has been modified.")
-
-                # Here the user function will run (if entered)
-                if user_function is not None and callable(user_function):
-                    user_function()
-                    logging.info("Function executed successfully.")
-
-                return get_current_language()
-            else:
-                return False
+        reg_key = winreg.OpenKey(hkey, subkey, 0, KEY_NOTIFY)
+        track_open("registry_key", RESOURCE_SITE)
+        reg_key_handle = ctypes.c_void_p(reg_key.handle)
+
+        event = CreateEventW(None, True, False, None)
+        if not event:
+            logging.error("Error creating event handle.")
+            return None
+        track_open("event", RESOURCE_SITE)
+
+        result = RegNotifyChangeKeyValue(
+            reg_key_handle,
+            False,
+            REG_NOTIFY_CHANGE_LAST_SET,
+            event,
+            True
+        )
+
+        if result != 0:
+            logging.error(f"Error setting up registry change notification. Error code: {result}")
+            return None
+
+        logging.info("Monitoring keyboard language layout changes.")
+
+        wait_result = WaitForSingleObject(event, duration)
+        if wait_result == 0:  # Event occurred
+            logging.info("Registry key has been modified.")
+
+            # Here the user function will run (if entered)
+            if user_function is not None and callable(user_function):
+                user_function()
+                logging.info("Function executed successfully.")
+
+            return get_current_language()
+        else:
+            return False
 
     except KeyboardInterrupt:
         logging.info("Stopped monitoring.")
     except Exception as e:
-        logging.error("Unexpected error:", e)
+        logging.error(f"Unexpected error: {e}")
     finally:
+        # Close everything that was opened, and only what was opened
         if event:
-            kernel32.CloseHandle(event)
-
+            CloseHandle(event)
+            track_close("event", RESOURCE_SITE)
+        if reg_key is not None:
+            reg_key.Close()
+            track_close("registry_key", RESOURCE_SITE)
 
 if __name__ == "__main__":
 
@@ -1,6 +1,7 @@
 import os
 import logging
 import winreg as reg
+from modules.Registry_cache import registry_cache
 
 key_path = r'Software\Microsoft\Windows\CurrentVersion\Run'
 
@@ -25,11 +26,9 @@ def load_on_startup(app_absolute_path_with_extension: str):
     quoted_path = f'"{app_absolute_path_with_extension}"'
 
     try:
-        # Open the key for writing; if it doesn't exist, it will be created
-        with reg.OpenKey(reg.HKEY_CURRENT_USER, key_path, 0, reg.KEY_SET_VALUE) as key:
-            # Add a value to the registry: the app name as the 'key' and the quoted path as the 'value'
-            reg.SetValueEx(key, app_name, 0, reg.REG_SZ, quoted_path)
-            logging.info(f"Created registry entry for '{app_name}' with path: {quoted_path}")
+        # Add a value to the registry: the app name as the 'key' and the quoted path as the 'value'
+        registry_cache.set_value(reg.HKEY_CURRENT_USER, key_path, app_name, reg.REG_SZ, quoted_path)
+        logging.info(f"Created registry entry for '{app_name}' with path: {quoted_path}")
     except Exception as e:
         logging.error(f"Error creating registry key for '{app_name}': {e}")
 
@@ -45,10 +44,8 @@ def remove_load_on_startup(app_absolute_path_with_extension: str):
     app_name = os.path.splitext(os.path.basename(app_absolute_path_with_extension))[0]
 
     try:
-        # Open the key for deletion
-        with reg.OpenKey(reg.HKEY_CURRENT_USER, key_path, 0, reg.KEY_SET_VALUE) as key:
-            reg.DeleteValue(key, app_name)
-            logging.info(f"Removed registry entry for '{app_name}'")
+        registry_cache.delete_value(reg.HKEY_CURRENT_USER, key_path, app_name)
+        logging.info(f"Removed registry entry for '{app_name}'")
     except FileNotFoundError:
         logging.warning(f"Registry key for '{app_name}' not found")
     except Exception as e:
@@ -69,11 +66,9 @@ def is_load_on_startup(app_absolute_path_with_extension: str) -> bool:
     app_name = os.path.splitext(os.path.basename(app_absolute_path_with_extension))[0]
 
     try:
-        # Open the key for reading
-        with reg.OpenKey(reg.HKEY_CURRENT_USER, key_path, 0, reg.KEY_READ) as key:
-            # Check if the value exists
-            value, _ = reg.QueryValueEx(key, app_name)
-            return value == f'"{app_absolute_path_with_extension}"'
+        # Check if the value exists (served from the cache until the Run key changes)
+        value, _ = registry_cache.query_value(reg.HKEY_CURRENT_USER, key_path, app_name)
+        return value == f'"{app_absolute_path_with_extension}"'
     except FileNotFoundError:
         return False
     except Exception as e:
@@ -0,0 +1,310 @@
+"""
+Created by: Ori Halevi
+GitHub: https://github.com/ori-halevi
+Python 3.12
+
+Description: A shared, read-through cache for all the registry values the app reads.
+
+Every cached key stays open (with only the access needed to read it and watch it) and has a registry change
+notification armed on it. Reads check the notification event without waiting: if the key changed, its cached values
+are dropped and read again; otherwise they are served from memory. So a value is never older than the last
+change of its key, and nothing is re-read just because time passed.
+
+Writes go through the cache too, so they open keys with write access only and drop the values they replaced.
+"""
+from __future__ import annotations
+
+import ctypes
+import logging
+import threading
+import winreg
+from modules.Resource_accounting import track_open, track_close
+
+# Condition to toggle to see DEBUG logging
+DEBUG = False
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG if DEBUG else None,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Constants for registry notifications and wait statuses
+KEY_NOTIFY = 0x00000010  # Allows a registry key to be monitored for changes
+REG_NOTIFY_CHANGE_NAME = 0x00000001  # Notifies when a subkey is added or deleted
+REG_NOTIFY_CHANGE_LAST_SET = 0x00000004  # Notifies when a value of the key is added, deleted or changed
+REG_NOTIFY_THREAD_AGNOSTIC = 0x10000000  # The notification stays armed after the calling thread exits
+WAIT_OBJECT_0 = 0x00000000  # The event is signaled
+ERROR_NO_MORE_ITEMS = 259  # EnumValue reached the end of the values
+ERROR_KEY_DELETED = 1018  # The key was deleted while it was open
+
+# Load Windows API libraries
+advapi32 = ctypes.WinDLL('advapi32')  # Windows API for registry functions
+kernel32 = ctypes.WinDLL('kernel32')  # Core Windows API
+
+# Define ctypes types for function calls
+HANDLE = ctypes.c_void_p  # Handle type for registry keys and events
+DWORD = ctypes.c_ulong  # Unsigned long type for various parameters
+
+# Define functions from the Windows API
+RegNotifyChangeKeyValue = advapi32.RegNotifyChangeKeyValue
+RegNotifyChangeKeyValue.argtypes = [HANDLE, ctypes.c_bool, DWORD, HANDLE, ctypes.c_bool]
+RegNotifyChangeKeyValue.restype = ctypes.c_long
+
+CreateEventW = kernel32.CreateEventW
+CreateEventW.argtypes = [ctypes.c_void_p, ctypes.c_bool, ctypes.c_bool, ctypes.c_wchar_p]
+CreateEventW.restype = HANDLE
+
+ResetEvent = kernel32.ResetEvent
+ResetEvent.argtypes = [HANDLE]
+ResetEvent.restype = ctypes.c_bool
+
+WaitForSingleObject = kernel32.WaitForSingleObject
+WaitForSingleObject.argtypes = [HANDLE, DWORD]
+WaitForSingleObject.restype = DWORD
+
+CloseHandle = kernel32.CloseHandle
+CloseHandle.argtypes = [HANDLE]
+CloseHandle.restype = ctypes.c_bool
+
+# Creation sites of the handles opened by the cache, for resource accounting
+WATCH_SITE = "Registry_cache.watched_key"
+WRITE_SITE = "Registry_cache.write"
+
+# Marks a value that is known not to exist
+_MISSING = object()
+
+
+class _WatchedKey:
+    """
+    An open registry key with a change notification, and the values that were read from it.
+    """
+
+    def __init__(self, root: int, path: str):
+        # Only what is needed to read the values and watch the key
+        self.handle = winreg.OpenKey(root, path, 0, winreg.KEY_QUERY_VALUE | KEY_NOTIFY)
+        self.event = CreateEventW(None, True, False, None)
+        if not self.event:
+            self.handle.Close()
+            raise OSError("Error creating event handle.")
+        track_open("registry_key", WATCH_SITE)
+        track_open("event", WATCH_SITE)
+        self.values: dict[str, object] = {}
+        self.enumerated_values = None
+
+    def arm(self) -> None:
+        """
+        Asks Windows to signal the event on the next change of the key.
+        """
+        ResetEvent(self.event)
+        result = RegNotifyChangeKeyValue(ctypes.c_void_p(self.handle.handle), False,
+                                         REG_NOTIFY_CHANGE_NAME | REG_NOTIFY_CHANGE_LAST_SET |
+                                         REG_NOTIFY_THREAD_AGNOSTIC, self.event, True)
+        if result != 0:
+            raise OSError(f"Error setting up registry change notification. Error code: {result}")
+
+    def has_changed(self) -> bool:
+        """
+        Returns True if the key changed since the notification was armed. Doesn't wait.
+        """
+        return WaitForSingleObject(self.event, 0) == WAIT_OBJECT_0
+
+    def close(self) -> None:
+        self.handle.Close()
+        CloseHandle(self.event)
+        track_close("registry_key", WATCH_SITE)
+        track_close("event", WATCH_SITE)
+
+
+class RegistryCache:
+    """
+    Caches registry values per key and drops them when the key changes.
+    """
+
+    def __init__(self):
+        self._keys: dict[tuple[int, str], _WatchedKey] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _get_key(self, root: int, path: str) -> _WatchedKey:
+        """
+        Returns the watched key, opening it on first use. Its values are dropped if it changed.
+        Raises FileNotFoundError if the key doesn't exist (missing keys aren't cached, as they can't be watched).
+        """
+        key_id = (root, path.lower())
+        key = self._keys.get(key_id)
+        if key is None:
+            key = _WatchedKey(root, path)
+            try:
+                key.arm()
+            except OSError:
+                key.close()
+                raise
+            self._keys[key_id] = key
+        elif key.has_changed():
+            self.invalidations += 1
+            logging.debug(f"Registry key changed: {path}")
+            try:
+                # Arm again before reading, so a change that happens during the next read isn't missed
+                key.arm()
+            except OSError:
+                # The key was deleted (maybe created again), and its handle is dead: open it again
+                self._drop_key(root, path)
+                return self._get_key(root, path)
+            key.values.clear()
+            key.enumerated_values = None
+        return key
+
+    def _drop_key(self, root: int, path: str) -> None:
+        """
+        Closes a watched key and forgets it, so the next read opens it again.
+        """
+        key = self._keys.pop((root, path.lower()), None)
+        if key is not None:
+            key.close()
+
+    def query_value(self, root: int, path: str, name: str) -> tuple[object, int]:
+        """
+        Works like ``winreg.QueryValueEx``, from the cache when possible.
+
+        Args:
+            root (int): The root key, e.g. winreg.HKEY_CURRENT_USER.
+            path (str): The path of the key.
+            name (str): The name of the value.
+
+        Returns:
+            tuple[object, int]: The data of the value and its registry type.
+        """
+        with self._lock:
+            key = self._get_key(root, path)
+            cached = key.values.get(name)
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                try:
+                    cached = winreg.QueryValueEx(key.handle, name)
+                except FileNotFoundError:
+                    cached = _MISSING
+                except OSError as e:
+                    if e.winerror != ERROR_KEY_DELETED:
+                        raise
+                    # Deleted after the notification was checked: the next read opens the key again
+                    self._drop_key(root, path)
+                    raise FileNotFoundError(f"The registry key '{path}' was deleted.") from e
+                key.values[name] = cached
+
+        if cached is _MISSING:
+            raise FileNotFoundError(f"The registry value '{name}' was not found in '{path}'.")
+        return cached
+
+    def enum_values(self, root: int, path: str) -> list[tuple[str, object, int]]:
+        """
+        Returns all the values of a key, like calling ``winreg.EnumValue`` until it ends, from the cache when
+        possible.
+
+        Args:
+            root (int): The root key, e.g. winreg.HKEY_CURRENT_USER.
+            path (str): The path of the key.
+
+        Returns:
+            list[tuple[str, object, int]]: The name, data and registry type of every value.
+        """
+        with self._lock:
+            key = self._get_key(root, path)
+            if key.enumerated_values is not None:
+                self.hits += 1
+                return list(key.enumerated_values)
+
+            self.misses += 1
+            values = []
+            i = 0
+            while True:
+                try:
+                    values.append(winreg.EnumValue(key.handle, i))
+                    i += 1
+                except OSError as e:
+                    if e.winerror == ERROR_NO_MORE_ITEMS:
+                        break  # Exit when there are no more values
+                    if e.winerror == ERROR_KEY_DELETED:
+                        # Deleted after the notification was checked: the next read opens the key again
+                        self._drop_key(root, path)
+                        raise FileNotFoundError(f"The registry key '{path}' was deleted.") from e
+                    raise  # Anything else is an error, not the end of the values - don't cache it
+            key.enumerated_values = values
+            return list(values)
+
+    def _forget_value(self, root: int, path: str, name: str) -> None:
+        with self._lock:
+            key = self._keys.get((root, path.lower()))
+            if key is not None:
+                key.values.pop(name, None)
+                key.enumerated_values = None
+
+    def set_value(self, root: int, path: str, name: str, value_type: int, value) -> None:
+        """
+        Works like ``winreg.SetValueEx``, opening the key with write access only.
+
+        Args:
+            root (int): The root key, e.g. winreg.HKEY_CURRENT_USER.
+            path (str): The path of the key.
+            name (str): The name of the value.
+            value_type (int): The registry type, e.g. winreg.REG_DWORD.
+            value: The data to write.
+        """
+        with winreg.OpenKey(root, path, 0, winreg.KEY_SET_VALUE) as key:
+            track_open("registry_key", WRITE_SITE)
+            try:
+                winreg.SetValueEx(key, name, 0, value_type, value)
+            finally:
+                track_close("registry_key", WRITE_SITE)
+        self._forget_value(root, path, name)
+
+    def delete_value(self, root: int, path: str, name: str) -> None:
+        """
+        Works like ``winreg.DeleteValue``, opening the key with write access only.
+
+        Args:
+            root (int): The root key, e.g. winreg.HKEY_CURRENT_USER.
+            path (str): The path of the key.
+            name (str): The name of the value.
+        """
+        with winreg.OpenKey(root, path, 0, winreg.KEY_SET_VALUE) as key:
+            track_open("registry_key", WRITE_SITE)
+            try:
+                winreg.DeleteValue(key, name)
+            finally:
+                track_close("registry_key", WRITE_SITE)
+        self._forget_value(root, path, name)
+
+    def get_stats(self) -> dict[str, int]:
+        """
+        Returns the number of hits, misses and invalidations, and how many keys are watched.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "watched_keys": len(self._keys),
+            }
+
+    def close(self) -> None:
+        """
+        Closes all the watched keys and drops the cache.
+        """
+        with self._lock:
+            for key in self._keys.values():
+                key.close()
+            self._keys.clear()
+
+
+# The cache shared by all the modules of the app
+registry_cache = RegistryCache()
+
+
+if __name__ == "__main__":
+    personalize_path = r"Software\Microsoft\Windows\CurrentVersion\Themes\Personalize"
+    for _ in range(3):
+        print(registry_cache.query_value(winreg.HKEY_CURRENT_USER, personalize_path, "ColorPrevalence"))
+    print(registry_cache.get_stats())
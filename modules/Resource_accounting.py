@@ -0,0 +1,201 @@
+"""
+Created by: Ori Halevi
+GitHub: https://github.com/ori-halevi
+Python 3.12
+
+Description: Keeps count of the Win32 handles (events, registry keys, hooks) the app opens and closes, per kind and
+per creation site, and of its live threads, so a leak on a long-running machine shows up as a growing number.
+
+``run_soak_test`` replays many simulated switches and fails if any of the counts (or the process handle count)
+grew between the start and the end.
+"""
+from __future__ import annotations
+
+import ctypes
+import gc
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+# Condition to toggle to see DEBUG logging
+DEBUG = False
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG if DEBUG else None,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# How long the soak test waits for threads of the last switches to end before counting, in seconds
+SETTLE_TIMEOUT = 5.0
+
+_open_resources: Counter[tuple[str, str]] = Counter()
+_opened_total: Counter[tuple[str, str]] = Counter()
+_lock = threading.Lock()
+
+
+def track_open(kind: str, site: str) -> None:
+    """
+    Records that a resource was opened.
+
+    Args:
+        kind (str): The kind of resource, e.g. "event" or "registry_key".
+        site (str): Where it was created, e.g. "Language_change_monitor.start_monitor_language_in_registry_key".
+    """
+    with _lock:
+        _open_resources[(kind, site)] += 1
+        _opened_total[(kind, site)] += 1
+
+
+def track_close(kind: str, site: str) -> None:
+    """
+    Records that a resource opened at the given site was closed.
+
+    Args:
+        kind (str): The kind of resource.
+        site (str): The site that was passed to ``track_open``.
+    """
+    with _lock:
+        _open_resources[(kind, site)] -= 1
+
+
+def get_open_resources() -> dict[str, dict[str, int]]:
+    """
+    Returns how many resources of every kind are open, per creation site.
+    """
+    with _lock:
+        report = {}
+        for (kind, site), count in sorted(_open_resources.items()):
+            report.setdefault(kind, {})[site] = count
+        return report
+
+
+def get_opened_totals() -> dict[str, dict[str, int]]:
+    """
+    Returns how many resources of every kind were ever opened, per creation site.
+    """
+    with _lock:
+        report = {}
+        for (kind, site), count in sorted(_opened_total.items()):
+            report.setdefault(kind, {})[site] = count
+        return report
+
+
+def get_thread_counts() -> dict[str, int]:
+    """
+    Returns the number of live threads, grouped by name (numbered threads such as "language-hook_3" are counted
+    together), plus the total.
+    """
+    counts = Counter(re.sub(r'[-_]?\d+$', '', thread.name) for thread in threading.enumerate())
+    counts["total"] = sum(counts.values())
+    return dict(sorted(counts.items()))
+
+
+def get_process_handle_count() -> int | None:
+    """
+    Returns the number of handles the process has open, or None if it can't be retrieved.
+    """
+    try:
+        count = ctypes.c_ulong()
+        if ctypes.windll.kernel32.GetProcessHandleCount(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                        ctypes.byref(count)):
+            return count.value
+    except (AttributeError, OSError):
+        pass
+    return None
+
+
+def get_resource_report() -> dict:
+    """
+    Returns everything this module counts, for diagnostics.
+    """
+    return {
+        "open": get_open_resources(),
+        "opened_total": get_opened_totals(),
+        "threads": get_thread_counts(),
+        "process_handles": get_process_handle_count(),
+    }
+
+
+def _find_growth(before: dict, after: dict) -> list[str]:
+    """
+    Returns a description of every count that is higher after than before.
+    """
+    growth = []
+    for kind, sites in after["open"].items():
+        for site, count in sites.items():
+            old_count = before["open"].get(kind, {}).get(site, 0)
+            if count > old_count:
+                growth.append(f"open {kind} at {site}: {old_count} -> {count}")
+    for name, count in after["threads"].items():
+        old_count = before["threads"].get(name, 0)
+        if count > old_count:
+            growth.append(f"threads '{name}': {old_count} -> {count}")
+    if before["process_handles"] is not None and after["process_handles"] is not None \
+            and after["process_handles"] > before["process_handles"]:
+        growth.append(f"process handles: {before['process_handles']} -> {after['process_handles']}")
+    return growth
+
+
+def _settle(baseline_threads: int) -> None:
+    """
+    Waits until threads started by the last switches have ended and garbage is collected.
+    """
+    deadline = time.perf_counter() + SETTLE_TIMEOUT
+    while threading.active_count() > baseline_threads and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    gc.collect()
+
+
+def run_soak_test(simulate_switch: callable, switches: int = 5000, warmup: int = 100) -> tuple[bool, list[str]]:
+    """
+    Replays simulated switches and checks that no resource count grew.
+
+    The first switches are a warmup: caches and thread pools fill up during them and are expected to stay.
+
+    Args:
+        simulate_switch (callable): Called as ``simulate_switch(i)`` for every switch.
+        switches (int): The number of switches to count.
+        warmup (int): The number of switches to run before taking the first count.
+
+    Returns:
+        tuple[bool, list[str]]: Whether the test passed, and a description of every count that grew.
+    """
+    baseline_threads = threading.active_count()
+    for i in range(warmup):
+        simulate_switch(i)
+    _settle(baseline_threads)
+    before = get_resource_report()
+
+    start = time.perf_counter()
+    for i in range(warmup, warmup + switches):
+        simulate_switch(i)
+    elapsed = time.perf_counter() - start
+    _settle(before["threads"]["total"])
+    after = get_resource_report()
+
+    growth = _find_growth(before, after)
+    logging.info(f"Soak test: {switches} switches in {elapsed:.1f}s, "
+                 f"{'no growth' if not growth else f'{len(growth)} growing counts'}.")
+    return not growth, growth
+
+
+if __name__ == "__main__":
+
+    leaked = []
+
+    def leaky_switch(i):
+        track_open("event", "example.leaky_switch")
+        if i % 10:
+            track_close("event", "example.leaky_switch")
+        else:
+            leaked.append(i)
+
+    def clean_switch(_):
+        track_open("registry_key", "example.clean_switch")
+        track_close("registry_key", "example.clean_switch")
+        threading.Thread(target=time.sleep, args=(0.001,), name="example-worker").start()
+
+    print(run_soak_test(clean_switch, switches=500))
+    print(run_soak_test(leaky_switch, switches=500))
+    print(get_resource_report())
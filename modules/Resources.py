@@ -0,0 +1,168 @@
+"""
+Created by: Ori Halevi
+GitHub: https://github.com/ori-halevi
+Python 3.12
+
+Description: Serves the files bundled with the app (the tray icon and the language table) straight from where they
+ship: the PyInstaller bundle ("sys._MEIPASS") when running as an executable, or the project folder otherwise. Also
+locates the app's data folder in LOCALAPPDATA, where the files the app writes are kept.
+
+Resources are located relative to this file, never relative to the current directory, so they are found no matter
+where the app is launched from (e.g. from the Run key). Nothing is copied to disk: each file is read once, kept in
+memory, and handed out as a read-only memoryview, and the decoded forms (the language table and the icon image)
+are cached as well.
+"""
+from __future__ import annotations
+
+import io
+import json
+import logging
+import os
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+from PIL import Image
+
+# Condition to toggle to see DEBUG logging
+DEBUG = False
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG if DEBUG else None,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Names of the bundled resources
+LANGUAGE_TABLE_NAME = "language_data.json"
+TRAY_ICON_NAME = "windows-11-change-taskbar-color.png"
+
+# Name of the app's data folder in LOCALAPPDATA
+APP_DATA_FOLDER_NAME = "taskbar-color-change-by-lang"
+
+
+def get_resource_root() -> Path:
+    """
+    Returns the folder the bundled resources are in.
+    """
+    if hasattr(sys, '_MEIPASS'):
+        # When running as a bundled executable
+        return Path(sys._MEIPASS)
+    # When running in a development environment: the project folder, one level above this package
+    return Path(__file__).resolve().parent.parent
+
+
+def get_app_data_path(name: str | None = None) -> str:
+    """
+    Returns the app's data folder in LOCALAPPDATA, or the path of a file in it. The folder is created if needed.
+
+    Args:
+        name (str | None): The name of the file, or None for the folder itself.
+
+    Returns:
+        str: The path of the folder or of the file.
+    """
+    # LOCALAPPDATA always exists on Windows; the home folder is used elsewhere (e.g. for the module demos)
+    appdata_path = os.getenv('LOCALAPPDATA') or os.path.expanduser('~')
+    app_folder = os.path.join(appdata_path, APP_DATA_FOLDER_NAME)
+    os.makedirs(app_folder, exist_ok=True)
+    return app_folder if name is None else os.path.join(app_folder, name)
+
+
+@lru_cache(maxsize=None)
+def _read_resource_bytes(name: str) -> bytes:
+    return (get_resource_root() / name).read_bytes()
+
+
+def read_resource(name: str) -> memoryview:
+    """
+    Returns the content of a bundled resource. The file is read only once.
+
+    Args:
+        name (str): The name of the resource.
+
+    Returns:
+        memoryview: A read-only view of the content.
+
+    Raises:
+        FileNotFoundError: If there is no such resource.
+    """
+    return memoryview(_read_resource_bytes(name))
+
+
+@lru_cache(maxsize=None)
+def load_language_table() -> dict[str, str]:
+    """
+    Returns the language table: the meaning of every country code (e.g. "en-US" -> "English - United States").
+    """
+    data = json.loads(_read_resource_bytes(LANGUAGE_TABLE_NAME))
+    return {item['Country code']: item['Meaning'] for item in data}
+
+
+@lru_cache(maxsize=None)
+def load_tray_icon() -> Image.Image:
+    """
+    Returns the image of the tray icon, decoded once.
+
+    Raises:
+        FileNotFoundError: If the icon is not bundled.
+    """
+    image = Image.open(io.BytesIO(_read_resource_bytes(TRAY_ICON_NAME)))
+    image.load()  # Decode now, while the cache is being filled
+    return image
+
+
+if __name__ == "__main__":
+    import os
+    import shutil
+    import tempfile
+    import time
+
+    # The old way: copy the file to a per-user folder on first use, then read and decode it from there on every call
+    def copy_on_first_use(target_folder, name):
+        target = os.path.join(target_folder, name)
+        if not os.path.exists(target):
+            shutil.copyfile(get_resource_root() / name, target)
+        return target
+
+    def load_language_table_by_copy(target_folder):
+        with open(copy_on_first_use(target_folder, LANGUAGE_TABLE_NAME), 'r', encoding='utf-8') as f:
+            return {item['Country code']: item['Meaning'] for item in json.load(f)}
+
+    def load_tray_icon_by_copy(target_folder):
+        image = Image.open(copy_on_first_use(target_folder, TRAY_ICON_NAME))
+        image.load()
+        return image
+
+    def measure(function, *args, repeats=100):
+        """
+        Returns the time of the first call, and the average time of the calls after it, in seconds.
+        """
+        start = time.perf_counter()
+        first_result = function(*args)
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(repeats):
+            function(*args)
+        return first_result, first, (time.perf_counter() - start) / repeats
+
+    # Read both files once and load the image plugins, so the first call of neither path pays for a cold disk cache
+    # or for importing the decoders
+    for resource_name in (LANGUAGE_TABLE_NAME, TRAY_ICON_NAME):
+        (get_resource_root() / resource_name).read_bytes()
+    Image.init()
+
+    # The same work on both sides: the table against the table, the icon against the icon
+    comparisons = [
+        ("Language table", load_language_table_by_copy, load_language_table),
+        ("Tray icon", load_tray_icon_by_copy, load_tray_icon),
+    ]
+    print(f"{'':<16} {'copy: first':>12} {'then':>10} {'loader: first':>14} {'then':>10}")
+    with tempfile.TemporaryDirectory() as folder:
+        for title, by_copy, by_loader in comparisons:
+            copied_result, first_copy, repeated_copy = measure(by_copy, folder)
+            loaded_result, first_load, repeated_load = measure(by_loader)
+            if isinstance(copied_result, dict):
+                assert copied_result == loaded_result
+            else:
+                assert copied_result.size == loaded_result.size and copied_result.tobytes() == loaded_result.tobytes()
+            print(f"{title:<16} {first_copy * 1000:>9.2f} ms {repeated_copy * 1000:>7.2f} ms "
+                  f"{first_load * 1000:>11.2f} ms {repeated_load * 1000:>7.4f} ms")
@@ -0,0 +1,229 @@
+"""
+Created by: Ori Halevi
+GitHub: https://github.com/ori-halevi
+Python 3.12
+
+Description: A low overhead sampling profiler for capturing what the app is doing when switching "feels laggy".
+
+While a session runs, a single background thread takes a snapshot of the stacks of all the other threads (the
+registry watcher, the color decision threads, the taskbar refresh, the tray...) every few milliseconds. When the
+session ends, which it does by itself after the requested number of seconds, two files are written:
+    - "<name>.folded": one line per distinct stack, ready for flamegraph.pl / speedscope.
+    - "<name>.pstats": the same samples in the pstats format, for pstats / snakeviz.
+
+Nothing is hooked into the interpreter, so when no session is running the profiler costs nothing at all.
+"""
+from __future__ import annotations
+
+import logging
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from modules.Resources import get_app_data_path
+
+# Condition to toggle to see DEBUG logging
+DEBUG = False
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG if DEBUG else None,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Default time between two samples, in seconds
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# Default length of a profiling session, in seconds
+DEFAULT_PROFILE_DURATION = 30
+
+
+def _frame_key(frame) -> tuple[str, int, str]:
+    """
+    Returns the pstats style key (file, first line, function name) of a frame.
+    """
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads for a limited time and saves the result.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        """
+        Args:
+            interval (float): Time between two samples, in seconds.
+        """
+        self.interval = interval
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self.samples: Counter[tuple] = Counter()
+        self.sample_count = 0
+        self.seconds_per_sample = interval
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float = DEFAULT_PROFILE_DURATION, output_folder: str | None = None,
+              on_finished: callable = None) -> str | None:
+        """
+        Starts a profiling session that stops by itself after the given duration.
+
+        Args:
+            duration (float): Length of the session, in seconds.
+            output_folder (str | None): Where to save the results. Defaults to the app's LOCALAPPDATA folder.
+            on_finished (callable): Optional function that is called with the path of the ".pstats" file.
+
+        Returns:
+            str | None: The path (without extension) the results will be saved to, or None if a session is
+            already running.
+        """
+        with self._lock:
+            if self.is_running():
+                logging.warning("A profiling session is already running.")
+                return None
+
+            output_folder = output_folder or get_app_data_path()
+            output_base = os.path.join(output_folder, time.strftime("profile-%Y%m%d-%H%M%S"))
+
+            self.samples = Counter()
+            self.sample_count = 0
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, args=(duration, output_base, on_finished),
+                                            name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+        logging.info(f"Profiling for {duration} seconds into {output_base}")
+        return output_base
+
+    def stop(self) -> None:
+        """
+        Ends the running session early. The results are still saved.
+        """
+        self._stop_event.set()
+
+    def _take_sample(self, own_thread_id: int) -> None:
+        """
+        Records the current stack of every thread except the profiler's own.
+        """
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_key(frame))
+                frame = frame.f_back
+            stack.reverse()  # Root first
+            self.samples[(thread_names.get(thread_id, str(thread_id)), tuple(stack))] += 1
+        self.sample_count += 1
+
+    def _run(self, duration: float, output_base: str, on_finished: callable) -> None:
+        own_thread_id = threading.get_ident()
+        start = time.perf_counter()
+        deadline = start + duration
+        while not self._stop_event.is_set() and time.perf_counter() < deadline:
+            self._take_sample(own_thread_id)
+            self._stop_event.wait(self.interval)
+        # Sampling itself takes some time, so the real time between samples is a bit longer than the interval
+        self.seconds_per_sample = (time.perf_counter() - start) / max(self.sample_count, 1)
+
+        try:
+            self.save_folded(output_base + ".folded")
+            self.save_pstats(output_base + ".pstats")
+            logging.info(f"Profile saved ({self.sample_count} samples): {output_base}.pstats")
+        except OSError as e:
+            logging.error(f"Error saving the profile: {e}")
+            return
+
+        if on_finished is not None:
+            on_finished(output_base + ".pstats")
+
+    def save_folded(self, path: str) -> None:
+        """
+        Saves the samples as folded stacks ("thread;frame;frame count"), the input format of flame graph tools.
+
+        Args:
+            path (str): The file to write.
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            for (thread_name, stack), count in self.samples.most_common():
+                frames = [thread_name] + [f"{name} ({os.path.basename(file)}:{line})" for file, line, name in stack]
+                f.write(f"{';'.join(frames)} {count}\n")
+
+    def save_pstats(self, path: str) -> None:
+        """
+        Saves the samples in the format that ``pstats.Stats`` loads. Times are estimated from the sample counts,
+        and the number of calls is the number of samples a function appeared in.
+
+        Args:
+            path (str): The file to write.
+        """
+        own_samples = Counter()
+        total_samples = Counter()
+        callers: dict[tuple, Counter] = {}
+
+        for (_, stack), count in self.samples.items():
+            if not stack:
+                continue
+            own_samples[stack[-1]] += count
+            for function in set(stack):  # Count recursive functions once per sample
+                total_samples[function] += count
+            for caller, callee in zip(stack, stack[1:]):
+                callers.setdefault(callee, Counter())[caller] += count
+
+        stats = {}
+        for function, total in total_samples.items():
+            own_time = own_samples[function] * self.seconds_per_sample
+            function_callers = {
+                caller: (count, count, 0.0, count * self.seconds_per_sample)
+                for caller, count in callers.get(function, Counter()).items()
+            }
+            stats[function] = (total, total, own_time, total * self.seconds_per_sample, function_callers)
+
+        with open(path, 'wb') as f:
+            marshal.dump(stats, f)
+
+
+# The profiler used by the app
+profiler = SamplingProfiler()
+
+
+def start_profiling_session(duration: float = DEFAULT_PROFILE_DURATION, on_finished: callable = None) -> str | None:
+    """
+    Starts a profiling session of the whole app that stops by itself after the given duration.
+
+    Args:
+        duration (float): Length of the session, in seconds.
+        on_finished (callable): Optional function that is called with the path of the ".pstats" file.
+
+    Returns:
+        str | None: The path (without extension) of the results, or None if a session is already running.
+    """
+    return profiler.start(duration, on_finished=on_finished)
+
+
+if __name__ == "__main__":
+    import pstats
+    import tempfile
+
+    def busy_work():
+        end = time.perf_counter() + 1
+        while time.perf_counter() < end:
+            sum(i * i for i in range(1000))
+
+    worker = threading.Thread(target=busy_work, name="busy-worker")
+    worker.start()
+
+    results = []
+    done = threading.Event()
+    example_profiler = SamplingProfiler()
+    example_profiler.start(1.5, tempfile.gettempdir(), on_finished=lambda path: (results.append(path), done.set()))
+    worker.join()
+    done.wait()
+
+    print(f"{example_profiler.sample_count} samples saved to {results[0]}")
+    pstats.Stats(results[0]).sort_stats("cumulative").print_stats(5)
@@ -0,0 +1,563 @@
+"""
+Created by: Ori Halevi
+GitHub: https://github.com/ori-halevi
+Python 3.12
+
+Description: Makes sure only one copy of the app runs for each user.
+
+Two running copies (e.g. the Startup folder shortcut and the "Load on Startup" Run key) would both react to every
+switch and toggle the color twice, so nothing visibly changes, at twice the cost.
+
+The first copy creates a named mutex in the session's "Local\\" namespace, which works as the lock: Windows frees it
+automatically if the copy crashes, and no other program can hold it by accident. The running copy then listens on a
+named pipe of its own (per session and user, local clients only). A second copy finds the mutex taken, so it
+forwards its command line action (toggle, set-preference, quit, status, diagnostics, profile) over the pipe to the
+running copy and exits.
+
+Every command carries a token that only the running copy and the user can read (it is kept in the user's
+LOCALAPPDATA folder), so other users on the machine can't control the app.
+
+``SocketInstanceGuard`` does the same over a local TCP port. It is only a stand-in for tests and for running the
+example outside of Windows.
+"""
+from __future__ import annotations
+
+import ctypes
+import getpass
+import json
+import logging
+import os
+import secrets
+import socket
+import threading
+import time
+from ctypes import wintypes
+from modules.Resources import get_app_data_path
+from modules.Resource_accounting import track_open, track_close
+
+# Condition to toggle to see DEBUG logging
+DEBUG = False
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG if DEBUG else None,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# The commands a second copy can forward to the running copy
+COMMANDS = ("toggle", "set-preference", "quit", "status", "diagnostics", "profile")
+
+# Name of the mutex that marks the running copy (one per session)
+MUTEX_NAME = "Local\\taskbar-color-change-by-lang-instance"
+
+# Prefix of the command pipe's name (the session and the user are added to it)
+PIPE_NAME_PREFIX = "\\\\.\\pipe\\taskbar-color-change-by-lang"
+
+# Only local connections are accepted by the socket stand-in
+HOST = "127.0.0.1"
+
+# Name of the file that holds the token of the running copy
+TOKEN_FILE_NAME = "instance.token"
+
+# Longest command or reply that is accepted, in bytes
+MAX_MESSAGE_SIZE = 64 * 1024
+
+# How long the running copy waits for a client to send its command or read the reply, in seconds
+CONNECTION_TIMEOUT = 2.0
+
+# Constants for the mutex and the named pipe
+ERROR_FILE_NOT_FOUND = 2
+ERROR_BROKEN_PIPE = 109
+ERROR_ALREADY_EXISTS = 183
+ERROR_PIPE_BUSY = 231
+ERROR_PIPE_CONNECTED = 535
+PIPE_ACCESS_DUPLEX = 0x00000003
+FILE_FLAG_FIRST_PIPE_INSTANCE = 0x00080000  # Fail if another program already created a pipe with this name
+PIPE_TYPE_BYTE = 0x00000000
+PIPE_WAIT = 0x00000000
+PIPE_REJECT_REMOTE_CLIENTS = 0x00000008
+GENERIC_READ = 0x80000000
+GENERIC_WRITE = 0x40000000
+OPEN_EXISTING = 3
+THREAD_TERMINATE = 0x0001  # The access CancelSynchronousIo needs
+INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+
+# Creation sites of the handles opened by the guard, for resource accounting
+MUTEX_SITE = "Single_instance.mutex"
+PIPE_SITE = "Single_instance.pipe"
+
+_kernel32 = None
+
+
+def _get_kernel32():
+    """
+    Loads kernel32.dll on first use, so the module (and the socket stand-in) can be used where it is not available.
+    """
+    global _kernel32
+    if _kernel32 is None:
+        _kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+
+        _kernel32.CreateMutexW.argtypes = [ctypes.c_void_p, wintypes.BOOL, wintypes.LPCWSTR]
+        _kernel32.CreateMutexW.restype = wintypes.HANDLE
+        _kernel32.CreateNamedPipeW.argtypes = [wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD, wintypes.DWORD,
+                                               wintypes.DWORD, wintypes.DWORD, wintypes.DWORD, ctypes.c_void_p]
+        _kernel32.CreateNamedPipeW.restype = wintypes.HANDLE
+        _kernel32.ConnectNamedPipe.argtypes = [wintypes.HANDLE, ctypes.c_void_p]
+        _kernel32.ConnectNamedPipe.restype = wintypes.BOOL
+        _kernel32.DisconnectNamedPipe.argtypes = [wintypes.HANDLE]
+        _kernel32.DisconnectNamedPipe.restype = wintypes.BOOL
+        _kernel32.WaitNamedPipeW.argtypes = [wintypes.LPCWSTR, wintypes.DWORD]
+        _kernel32.WaitNamedPipeW.restype = wintypes.BOOL
+        _kernel32.CreateFileW.argtypes = [wintypes.LPCWSTR, wintypes.DWORD, wintypes.DWORD, ctypes.c_void_p,
+                                          wintypes.DWORD, wintypes.DWORD, wintypes.HANDLE]
+        _kernel32.CreateFileW.restype = wintypes.HANDLE
+        _kernel32.ReadFile.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD,
+                                       ctypes.POINTER(wintypes.DWORD), ctypes.c_void_p]
+        _kernel32.ReadFile.restype = wintypes.BOOL
+        _kernel32.WriteFile.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD,
+                                        ctypes.POINTER(wintypes.DWORD), ctypes.c_void_p]
+        _kernel32.WriteFile.restype = wintypes.BOOL
+        _kernel32.FlushFileBuffers.argtypes = [wintypes.HANDLE]
+        _kernel32.FlushFileBuffers.restype = wintypes.BOOL
+        _kernel32.OpenThread.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
+        _kernel32.OpenThread.restype = wintypes.HANDLE
+        _kernel32.CancelSynchronousIo.argtypes = [wintypes.HANDLE]
+        _kernel32.CancelSynchronousIo.restype = wintypes.BOOL
+        _kernel32.ProcessIdToSessionId.argtypes = [wintypes.DWORD, ctypes.POINTER(wintypes.DWORD)]
+        _kernel32.ProcessIdToSessionId.restype = wintypes.BOOL
+        _kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        _kernel32.CloseHandle.restype = wintypes.BOOL
+    return _kernel32
+
+
+def get_pipe_name() -> str:
+    """
+    Returns the name of the command pipe of the current session and user. Pipe names are shared by the whole
+    machine, so copies in other sessions or of other users don't block each other.
+    """
+    session_id = wintypes.DWORD()
+    _get_kernel32().ProcessIdToSessionId(os.getpid(), ctypes.byref(session_id))
+    return f"{PIPE_NAME_PREFIX}-{session_id.value}-{getpass.getuser().lower()}"
+
+
+def _read_message(connection) -> dict | None:
+    """
+    Reads a single JSON line from a connection.
+    """
+    data = b""
+    while not data.endswith(b"\n") and len(data) < MAX_MESSAGE_SIZE:
+        chunk = connection.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    try:
+        message = json.loads(data.decode('utf-8'))
+    except ValueError:
+        return None
+    return message if isinstance(message, dict) else None
+
+
+def _send_message(connection, message: dict) -> None:
+    """
+    Sends a single JSON line over a connection.
+    """
+    connection.sendall(json.dumps(message).encode('utf-8') + b"\n")
+
+
+class _PipeConnection:
+    """
+    One end of a command pipe connection, with the ``recv``/``sendall`` methods of a socket.
+
+    Pipe handles are synchronous, so a timeout is enforced by cancelling the blocked call from a timer.
+    """
+
+    def __init__(self, handle: int, timeout: float, server: bool):
+        self.kernel32 = _get_kernel32()
+        self.handle = handle
+        self.timeout = timeout
+        self.server = server
+        self._thread_handle = self.kernel32.OpenThread(THREAD_TERMINATE, False, threading.get_native_id())
+        self._blocking = False
+        self._lock = threading.Lock()
+
+    def _cancel_blocked_call(self) -> None:
+        with self._lock:
+            if self._blocking:
+                self.kernel32.CancelSynchronousIo(self._thread_handle)
+
+    def _call(self, function: callable, *args) -> bool:
+        """
+        Calls a blocking pipe function, and cancels it if it takes longer than the timeout.
+        """
+        watchdog = threading.Timer(self.timeout, self._cancel_blocked_call)
+        watchdog.daemon = True
+        with self._lock:
+            self._blocking = True
+        watchdog.start()
+        try:
+            return function(*args)
+        finally:
+            # After this, the timer can no longer cancel anything (e.g. the next call)
+            with self._lock:
+                self._blocking = False
+            watchdog.cancel()
+
+    def recv(self, size: int) -> bytes:
+        buffer = ctypes.create_string_buffer(size)
+        read = wintypes.DWORD()
+        if not self._call(self.kernel32.ReadFile, self.handle, buffer, size, ctypes.byref(read), None):
+            error = ctypes.get_last_error()
+            if error == ERROR_BROKEN_PIPE:
+                return b""  # The other end closed the pipe
+            raise ctypes.WinError(error)
+        return buffer.raw[:read.value]
+
+    def sendall(self, data: bytes) -> None:
+        while data:
+            written = wintypes.DWORD()
+            if not self._call(self.kernel32.WriteFile, self.handle, data, len(data), ctypes.byref(written), None):
+                raise ctypes.WinError(ctypes.get_last_error())
+            data = data[written.value:]
+
+    def close(self) -> None:
+        if self.server:
+            # Wait until the client read the reply, then make the pipe ready for the next client
+            self._call(self.kernel32.FlushFileBuffers, self.handle)
+            self.kernel32.DisconnectNamedPipe(self.handle)
+        else:
+            self.kernel32.CloseHandle(self.handle)
+        if self._thread_handle:
+            self.kernel32.CloseHandle(self._thread_handle)
+            self._thread_handle = None
+
+
+class SingleInstanceGuard:
+    """
+    The single instance lock of the app (a named mutex), and the named pipe that receives commands from other
+    copies.
+    """
+
+    def __init__(self, token_file: str | None = None, mutex_name: str = MUTEX_NAME, pipe_name: str | None = None):
+        """
+        Args:
+            token_file (str | None): Where to keep the token. Defaults to the app's LOCALAPPDATA folder.
+            mutex_name (str): The name of the mutex used as the lock.
+            pipe_name (str | None): The name of the command pipe. Defaults to the pipe of the session and user.
+        """
+        self.token_file = token_file or get_app_data_path(TOKEN_FILE_NAME)
+        self.mutex_name = mutex_name
+        self.pipe_name = pipe_name
+        self.token = None
+        self.acquired = False
+        self._stopping = False
+        self._mutex = None
+        self._pipe = None
+        self._thread = None
+
+    # Lock and channel - the methods the socket stand-in replaces
+
+    def _acquire_lock(self) -> bool:
+        """
+        Takes the lock and opens the command channel. Returns False if another copy holds the lock.
+        """
+        kernel32 = _get_kernel32()
+        mutex = kernel32.CreateMutexW(None, False, self.mutex_name)
+        error = ctypes.get_last_error()
+        if not mutex:
+            raise ctypes.WinError(error)
+        if error == ERROR_ALREADY_EXISTS:
+            kernel32.CloseHandle(mutex)
+            return False
+        self._mutex = mutex
+        track_open("mutex", MUTEX_SITE)
+
+        self.pipe_name = self.pipe_name or get_pipe_name()
+        pipe = kernel32.CreateNamedPipeW(self.pipe_name, PIPE_ACCESS_DUPLEX | FILE_FLAG_FIRST_PIPE_INSTANCE,
+                                         PIPE_TYPE_BYTE | PIPE_WAIT | PIPE_REJECT_REMOTE_CLIENTS, 1,
+                                         MAX_MESSAGE_SIZE, MAX_MESSAGE_SIZE, 0, None)
+        if pipe == INVALID_HANDLE_VALUE:
+            # Still the only copy, it just can't receive commands
+            logging.error(f"Could not create the command pipe: {ctypes.WinError(ctypes.get_last_error())}")
+        else:
+            self._pipe = pipe
+            track_open("pipe", PIPE_SITE)
+        return True
+
+    def _accept(self):
+        """
+        Waits for the next client. Returns its connection, or None if the channel was closed.
+        """
+        kernel32 = _get_kernel32()
+        if not kernel32.ConnectNamedPipe(self._pipe, None):
+            error = ctypes.get_last_error()
+            if error != ERROR_PIPE_CONNECTED:  # A client that connected before the call is fine
+                if not self._stopping:
+                    logging.error(f"Error waiting for a command: {ctypes.WinError(error)}")
+                return None
+        return _PipeConnection(self._pipe, CONNECTION_TIMEOUT, server=True)
+
+    def _wake_server(self) -> None:
+        """
+        Wakes up the thread that waits for clients, so it notices that the guard is stopping.
+        """
+        connection = self._connect(CONNECTION_TIMEOUT)
+        if connection is not None:
+            connection.close()
+
+    def _release_lock(self) -> None:
+        """
+        Closes the command channel and frees the lock.
+        """
+        kernel32 = _get_kernel32()
+        if self._pipe is not None:
+            kernel32.CloseHandle(self._pipe)
+            self._pipe = None
+            track_close("pipe", PIPE_SITE)
+        if self._mutex is not None:
+            kernel32.CloseHandle(self._mutex)
+            self._mutex = None
+            track_close("mutex", MUTEX_SITE)
+
+    def _connect(self, timeout: float):
+        """
+        Connects to the running copy. Returns the connection, or None if no copy is listening.
+        """
+        kernel32 = _get_kernel32()
+        pipe_name = self.pipe_name or get_pipe_name()
+        deadline = time.monotonic() + timeout
+        while True:
+            handle = kernel32.CreateFileW(pipe_name, GENERIC_READ | GENERIC_WRITE, 0, None, OPEN_EXISTING, 0, None)
+            if handle != INVALID_HANDLE_VALUE:
+                return _PipeConnection(handle, timeout, server=False)
+            error = ctypes.get_last_error()
+            remaining = deadline - time.monotonic()
+            if error != ERROR_PIPE_BUSY or remaining <= 0:
+                if error != ERROR_FILE_NOT_FOUND:
+                    logging.error(f"Could not connect to the command pipe: {ctypes.WinError(error)}")
+                return None
+            # The running copy is busy with another command
+            kernel32.WaitNamedPipeW(pipe_name, max(int(remaining * 1000), 1))
+
+    # The guard itself
+
+    def acquire(self) -> bool:
+        """
+        Tries to become the running copy.
+
+        Returns:
+            bool: True if this is now the running copy, False if another copy already runs.
+        """
+        if not self._acquire_lock():
+            return False
+
+        self.token = secrets.token_hex(16)
+        with open(self.token_file, 'w') as f:
+            f.write(self.token)
+
+        self.acquired = True
+        self._stopping = False
+        logging.info("Running as the single instance.")
+        return True
+
+    def serve(self, handler: callable) -> None:
+        """
+        Starts handling commands from other copies in a background thread.
+
+        Args:
+            handler (callable): Called as ``handler(command, argument)`` for every command. Whatever it returns
+                (must be JSON serializable) is sent back to the other copy.
+        """
+        if not self.acquired:
+            raise RuntimeError("The single instance lock was not acquired.")
+        self._thread = threading.Thread(target=self._serve, args=(handler,), name="single-instance", daemon=True)
+        self._thread.start()
+
+    def _serve(self, handler: callable) -> None:
+        while not self._stopping:
+            connection = self._accept()
+            if connection is None:
+                break  # The channel was closed
+            try:
+                if self._stopping:
+                    break  # Woken up by release()
+                message = _read_message(connection)
+                if message is None or not secrets.compare_digest(str(message.get("token")), self.token):
+                    _send_message(connection, {"ok": False, "error": "Invalid request."})
+                    continue
+                command = message.get("command")
+                if command not in COMMANDS:
+                    _send_message(connection, {"ok": False, "error": f"Unknown command: {command}"})
+                    continue
+                logging.info(f"Received the '{command}' command from another instance.")
+                result = handler(command, message.get("argument"))
+                _send_message(connection, {"ok": True, "result": result})
+            except Exception as e:
+                logging.error(f"Error handling a command from another instance: {e}")
+                try:
+                    _send_message(connection, {"ok": False, "error": str(e)})
+                except OSError:
+                    pass
+            finally:
+                try:
+                    connection.close()
+                except OSError:
+                    pass
+
+    def release(self) -> None:
+        """
+        Releases the lock and stops handling commands.
+        """
+        if not self.acquired:
+            return
+        self._stopping = True
+        if self._thread is not None and self._thread.is_alive():
+            self._wake_server()
+            self._thread.join(CONNECTION_TIMEOUT)
+        self._thread = None
+        self._release_lock()
+        self.acquired = False
+        try:
+            os.remove(self.token_file)
+        except OSError:
+            pass
+
+    def send_command(self, command: str, argument=None, timeout: float = 5.0) -> dict | None:
+        """
+        Sends a command to the running copy and waits for its reply.
+
+        Args:
+            command (str): One of COMMANDS.
+            argument: An optional argument for the command (must be JSON serializable).
+            timeout (float): How long to wait for the reply, in seconds.
+
+        Returns:
+            dict | None: The reply ({"ok": ..., "result" or "error": ...}), or None if no copy could be reached.
+        """
+        try:
+            with open(self.token_file, 'r') as f:
+                token = f.read().strip()
+            connection = self._connect(timeout)
+            if connection is None:
+                logging.error("Could not reach the running instance.")
+                return None
+            try:
+                _send_message(connection, {"token": token, "command": command, "argument": argument})
+                return _read_message(connection)
+            finally:
+                connection.close()
+        except OSError as e:
+            logging.error(f"Could not reach the running instance: {e}")
+            return None
+
+
+class _SocketConnection:
+    """
+    A connection of the socket stand-in. Lets the client close first, so the lock's port isn't left with closed
+    connections.
+    """
+
+    def __init__(self, connection: socket.socket, server: bool):
+        self.connection = connection
+        self.server = server
+
+    def recv(self, size: int) -> bytes:
+        return self.connection.recv(size)
+
+    def sendall(self, data: bytes) -> None:
+        self.connection.sendall(data)
+
+    def close(self) -> None:
+        try:
+            if self.server:
+                self.connection.recv(1)  # Wait for the client to close
+        finally:
+            self.connection.close()
+
+
+class SocketInstanceGuard(SingleInstanceGuard):
+    """
+    A stand-in for tests: a bound local TCP port is the lock, and the same socket is the command channel.
+    """
+
+    def __init__(self, port: int, token_file: str | None = None):
+        """
+        Args:
+            port (int): The local port used as the lock.
+            token_file (str | None): Where to keep the token. Defaults to the app's LOCALAPPDATA folder.
+        """
+        super().__init__(token_file)
+        self.port = port
+        self._server = None
+
+    def _acquire_lock(self) -> bool:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if hasattr(socket, "SO_EXCLUSIVEADDRUSE"):
+            # Without it, Windows lets another socket bind the same port
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        else:
+            # Elsewhere a second listening socket is refused anyway; this only ignores old closed connections
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            server.bind((HOST, self.port))
+            server.listen(5)
+        except OSError:
+            server.close()
+            return False
+        self._server = server
+        return True
+
+    def _accept(self):
+        try:
+            connection, _ = self._server.accept()
+        except OSError:
+            return None  # The lock was released
+        connection.settimeout(CONNECTION_TIMEOUT)
+        return _SocketConnection(connection, server=True)
+
+    def _wake_server(self) -> None:
+        try:
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _release_lock(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    def _connect(self, timeout: float):
+        try:
+            return _SocketConnection(socket.create_connection((HOST, self.port), timeout=timeout), server=False)
+        except OSError:
+            return None
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    # Two guards on the same port stand in for two copies of the app
+    example_token_file = os.path.join(tempfile.gettempdir(), "single-instance-example.token")
+    with socket.socket() as free_port_socket:
+        free_port_socket.bind((HOST, 0))
+        example_port = free_port_socket.getsockname()[1]
+
+    first = SocketInstanceGuard(example_port, example_token_file)
+    second = SocketInstanceGuard(example_port, example_token_file)
+    assert first.acquire() is True
+    assert second.acquire() is False
+
+    first.serve(lambda command, argument: f"handled {command} {argument}")
+    assert second.send_command("set-preference", "Hebrew") == {"ok": True, "result": "handled set-preference Hebrew"}
+    assert second.send_command("profile", 30) == {"ok": True, "result": "handled profile 30"}
+    assert second.send_command("unknown") == {"ok": False, "error": "Unknown command: unknown"}
+
+    # A client with the wrong token is refused
+    with open(example_token_file, 'w') as token_file:
+        token_file.write("wrong")
+    assert second.send_command("status") == {"ok": False, "error": "Invalid request."}
+    with open(example_token_file, 'w') as token_file:
+        token_file.write(first.token)
+
+    first.release()
+    assert second.send_command("status") is None
+    assert second.acquire() is True
+    second.release()
+    print("OK")
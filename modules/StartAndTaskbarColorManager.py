@@ -1,6 +1,10 @@
 import ctypes
+import json
 import logging
+import os
 import winreg
+from modules.Registry_cache import registry_cache
+from modules.Resources import get_app_data_path
 
 # Condition to toggle to see DEBUG logging
 DEBUG = False
@@ -8,8 +12,13 @@ DEBUG = False
 # Set up logging
 logging.basicConfig(level=logging.DEBUG if DEBUG else None,
                     format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Name of the file that keeps the user's own accent color while the app has replaced it
+ORIGINAL_ACCENT_FILE_NAME = "original_accent_color.json"
+
+
 class StartAndTaskbarColorManager:
-    def __init__(self):
+    def __init__(self, original_accent_file: str | None = None):
         # Load user32.dll to interact with the Windows GUI elements
         self.user32 = ctypes.windll.user32
         # Get the handle of the taskbar
@@ -17,29 +26,149 @@ class StartAndTaskbarColorManager:
         # Registry path and value name for taskbar color settings
         self.registry_path = r"Software\Microsoft\Windows\CurrentVersion\Themes\Personalize"
         self.color_prevalence_value_name = "ColorPrevalence"
+        # Registry paths and value names of the accent color used by the Start menu and the taskbar
+        self.dwm_registry_path = r"Software\Microsoft\Windows\DWM"
+        self.accent_registry_path = r"Software\Microsoft\Windows\CurrentVersion\Explorer\Accent"
+        self.accent_color_value_name = "AccentColor"
+        self.accent_color_menu_value_name = "AccentColorMenu"
+        # The accent color last set by this object
+        self.current_accent_color = None
+        # The user's own accent values, saved before the first change so they can be written back. They are kept
+        # in a file too, so they survive a crash and are not mistaken for the user's after a restart.
+        self.original_accent_file = original_accent_file or get_app_data_path(ORIGINAL_ACCENT_FILE_NAME)
+        self.original_accent_values = None
+        self._original_accent_file_checked = False
 
     def toggle_color_prevalence(self) -> None:
         """
         Changes the ColorPrevalence value in the system registry to toggle the color on the taskbar.
         """
         try:
-            # Opens the registry key
-            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, self.registry_path, 0,
-                                winreg.KEY_READ | winreg.KEY_WRITE) as registry_key:
-                # Read the current value
-                current_color_prevalence = winreg.QueryValueEx(registry_key, self.color_prevalence_value_name)[0]
-                # Change the current value to the opposite value
-                new_color_prevalence = 0 if current_color_prevalence == 1 else 1
-                # Set the new value
-                winreg.SetValueEx(registry_key, self.color_prevalence_value_name, 0, winreg.REG_DWORD, new_color_prevalence)
-                self._refresh_taskbar()
-
-                logging.debug(f"Changed ColorPrevalence from {current_color_prevalence} to {new_color_prevalence}")
+            # Read the current value
+            current_color_prevalence = registry_cache.query_value(winreg.HKEY_CURRENT_USER, self.registry_path,
+                                                                  self.color_prevalence_value_name)[0]
+            # Change the current value to the opposite value
+            new_color_prevalence = 0 if current_color_prevalence == 1 else 1
+            # Set the new value
+            registry_cache.set_value(winreg.HKEY_CURRENT_USER, self.registry_path, self.color_prevalence_value_name,
+                                     winreg.REG_DWORD, new_color_prevalence)
+            self._refresh_taskbar()
+
+            logging.debug(f"Changed ColorPrevalence from {current_color_prevalence} to {new_color_prevalence}")
         except FileNotFoundError:
             logging.error("Registry path or value not found.")
         except Exception as e:
             logging.error(f"An error occurred: {e}")
 
+    def set_accent_color(self, rgb: tuple[int, int, int], refresh: bool = True) -> bool:
+        """
+        Sets the accent color of the Start menu and the taskbar.
+
+        Args:
+            rgb (tuple[int, int, int]): The new accent color.
+            refresh (bool): Whether to refresh the taskbar now. Pass False when another change refreshes it anyway.
+
+        Returns:
+            bool: True if the color was changed, False if it already was this color or an error occurred.
+        """
+        rgb = tuple(rgb)
+        if rgb == self.current_accent_color:
+            return False
+
+        red, green, blue = rgb
+        # The registry keeps colors as 0xAABBGGRR
+        abgr_color = 0xFF000000 | (blue << 16) | (green << 8) | red
+        try:
+            self._save_original_accent_values()
+            registry_cache.set_value(winreg.HKEY_CURRENT_USER, self.dwm_registry_path, self.accent_color_value_name,
+                                     winreg.REG_DWORD, abgr_color)
+            registry_cache.set_value(winreg.HKEY_CURRENT_USER, self.accent_registry_path,
+                                     self.accent_color_menu_value_name, winreg.REG_DWORD, abgr_color)
+        except OSError as e:
+            logging.error(f"An error occurred while setting the accent color: {e}")
+            return False
+
+        self.current_accent_color = rgb
+        if refresh:
+            self._refresh_taskbar()
+        logging.debug(f"Changed the accent color to {rgb}")
+        return True
+
+    def _accent_values(self) -> dict[str, tuple[str, str]]:
+        """
+        Returns the registry path of every accent value, by value name.
+        """
+        return {
+            self.accent_color_value_name: self.dwm_registry_path,
+            self.accent_color_menu_value_name: self.accent_registry_path,
+        }
+
+    def _load_original_accent_values(self) -> dict[str, int | None] | None:
+        """
+        Returns the saved accent values of the user, or None if they were not replaced.
+        The file is read only once, so this is cheap to call on every sync.
+        """
+        if self.original_accent_values is None and not self._original_accent_file_checked:
+            self._original_accent_file_checked = True
+            try:
+                with open(self.original_accent_file, 'r') as f:
+                    self.original_accent_values = json.load(f)
+            except (OSError, ValueError):
+                return None
+        return self.original_accent_values
+
+    def _save_original_accent_values(self) -> None:
+        """
+        Saves the user's accent values before they are replaced for the first time.
+        """
+        if self._load_original_accent_values() is not None:
+            return  # Already saved (maybe by an earlier run that didn't restore them)
+
+        values = {}
+        for name, path in self._accent_values().items():
+            try:
+                values[name] = registry_cache.query_value(winreg.HKEY_CURRENT_USER, path, name)[0]
+            except FileNotFoundError:
+                values[name] = None  # The value didn't exist, so it is deleted on restore
+        with open(self.original_accent_file, 'w') as f:
+            json.dump(values, f)
+        self.original_accent_values = values
+
+    def restore_accent_color(self, refresh: bool = True) -> bool:
+        """
+        Writes back the user's own accent color, if it was replaced.
+
+        Args:
+            refresh (bool): Whether to refresh the taskbar now. Pass False when another change refreshes it anyway.
+
+        Returns:
+            bool: True if the color was restored, False if it wasn't replaced or an error occurred.
+        """
+        values = self._load_original_accent_values()
+        if values is None:
+            return False
+
+        try:
+            for name, path in self._accent_values().items():
+                if values.get(name) is not None:
+                    registry_cache.set_value(winreg.HKEY_CURRENT_USER, path, name, winreg.REG_DWORD, values[name])
+                else:
+                    try:
+                        registry_cache.delete_value(winreg.HKEY_CURRENT_USER, path, name)
+                    except FileNotFoundError:
+                        pass
+            os.remove(self.original_accent_file)
+        except OSError as e:
+            logging.error(f"An error occurred while restoring the accent color: {e}")
+            return False
+
+        self.original_accent_values = None
+        self.current_accent_color = None
+        if refresh:
+            self._refresh_taskbar()
+        logging.debug("Restored the original accent color")
+        return True
+
     def _refresh_taskbar(self) -> None:
         """
         Refreshes the taskbar by sending a settings change notification to the taskbar.
@@ -51,11 +180,10 @@ class StartAndTaskbarColorManager:
         :return: 1 if ColorPrevalence is on, and 0 otherwise.
         """
         try:
-            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, self.registry_path, 0,
-                                winreg.KEY_READ | winreg.KEY_WRITE) as registry_key:
-                # Read the current value
-                current_color_prevalence = winreg.QueryValueEx(registry_key, self.color_prevalence_value_name)[0]
-                return current_color_prevalence
+            # Read the current value (served from the cache until the key changes)
+            current_color_prevalence = registry_cache.query_value(winreg.HKEY_CURRENT_USER, self.registry_path,
+                                                                  self.color_prevalence_value_name)[0]
+            return current_color_prevalence
         except FileNotFoundError:
             logging.error("something went wrong!")
             return None  # Make sure to return None in case of error
@@ -0,0 +1,209 @@
+"""
+Created by: Ori Halevi
+GitHub: https://github.com/ori-halevi
+Python 3.12
+
+Description: Publishes the state of the app (layout, CapsLock, taskbar color) in a small block of shared memory, so
+status bar widgets and scripts can poll it as often as they like without any IPC and without loading the app.
+
+The block is a named memory mapping ("Local\\taskbar-color-change-by-lang-status") with this layout, little-endian:
+
+    offset  size  field
+    0       4     magic, b"TCSL"
+    4       2     format version (1)
+    6       2     size of the block in bytes
+    8       4     sequence number: odd while the app is writing, even when the block is consistent
+    12      4     keyboard layout ID (HKL)
+    16      1     CapsLock (0 or 1)
+    17      1     ColorPrevalence (0, 1, or -1 if unknown)
+    18      2     reserved
+    20      8     time of the last layout switch (seconds since the epoch, float64)
+    28      64    language name, UTF-8, zero padded
+
+Readers use a seqlock: read the sequence number, copy the block, and read the sequence number again. If it was odd
+or changed in between, the app wrote during the copy and the reader simply tries again. Readers never take a lock
+and never make a system call after the block is mapped.
+"""
+from __future__ import annotations
+
+import logging
+import mmap
+import struct
+import time
+
+# Condition to toggle to see DEBUG logging
+DEBUG = False
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG if DEBUG else None,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Name of the shared memory block (per user session)
+DEFAULT_SEGMENT_NAME = "Local\\taskbar-color-change-by-lang-status"
+
+# Identifies the block and its format
+MAGIC = b"TCSL"
+FORMAT_VERSION = 1
+
+# Layout of the block (see the module description)
+HEADER_FORMAT = struct.Struct("<4sHH")
+SEQUENCE_FORMAT = struct.Struct("<I")
+PAYLOAD_FORMAT = struct.Struct("<Ibb2xd64s")
+SEQUENCE_OFFSET = HEADER_FORMAT.size
+PAYLOAD_OFFSET = SEQUENCE_OFFSET + SEQUENCE_FORMAT.size
+SEGMENT_SIZE = PAYLOAD_OFFSET + PAYLOAD_FORMAT.size
+
+# How many times a reader tries again before giving up on a block that keeps changing
+MAX_READ_ATTEMPTS = 1000
+
+
+def _open_mapping(name: str | None, path: str | None) -> mmap.mmap:
+    """
+    Maps the named block, or a file when a path is given (for systems without named mappings, or for tests).
+    """
+    if path is not None:
+        with open(path, 'a+b') as f:
+            if f.seek(0, 2) < SEGMENT_SIZE:
+                f.truncate(SEGMENT_SIZE)
+            return mmap.mmap(f.fileno(), SEGMENT_SIZE)
+    return mmap.mmap(-1, SEGMENT_SIZE, tagname=name)
+
+
+class StatusSegmentWriter:
+    """
+    Writes the state of the app to the shared status block. Only the app itself should write.
+    """
+
+    def __init__(self, name: str = DEFAULT_SEGMENT_NAME, path: str | None = None):
+        """
+        Args:
+            name (str): The name of the shared memory block.
+            path (str | None): A file to map instead of a named block.
+        """
+        self._map = _open_mapping(name, path)
+        self._sequence = SEQUENCE_FORMAT.unpack_from(self._map, SEQUENCE_OFFSET)[0] & ~1
+        self._layout_id = None
+        self._last_switch_time = 0.0
+        HEADER_FORMAT.pack_into(self._map, 0, MAGIC, FORMAT_VERSION, SEGMENT_SIZE)
+
+    def publish(self, layout_id: int | None, caps_lock: bool, color_prevalence: int | None,
+                language: str | None = None) -> None:
+        """
+        Writes a new state. The time of the last switch is updated when the layout changes.
+
+        Args:
+            layout_id (int | None): The keyboard layout (HKL) of the foreground window.
+            caps_lock (bool): Whether CapsLock is on.
+            color_prevalence (int | None): The ColorPrevalence value, or None if unknown.
+            language (str | None): The name of the language.
+        """
+        layout_id = (layout_id or 0) & 0xFFFFFFFF
+        if layout_id != self._layout_id:
+            self._layout_id = layout_id
+            self._last_switch_time = time.time()
+
+        payload = PAYLOAD_FORMAT.pack(layout_id, int(bool(caps_lock)),
+                                      -1 if color_prevalence is None else int(color_prevalence),
+                                      self._last_switch_time, (language or "").encode('utf-8')[:64])
+
+        # Odd sequence number: readers know a write is in progress and try again
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        SEQUENCE_FORMAT.pack_into(self._map, SEQUENCE_OFFSET, self._sequence)
+        self._map[PAYLOAD_OFFSET:SEGMENT_SIZE] = payload
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        SEQUENCE_FORMAT.pack_into(self._map, SEQUENCE_OFFSET, self._sequence)
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class StatusSegmentReader:
+    """
+    Reads the state of the app from the shared status block. Any number of readers can poll at the same time.
+    """
+
+    def __init__(self, name: str = DEFAULT_SEGMENT_NAME, path: str | None = None):
+        """
+        Args:
+            name (str): The name of the shared memory block.
+            path (str | None): A file to map instead of a named block.
+        """
+        self._map = _open_mapping(name, path)
+
+    def read_sequence(self) -> int:
+        """
+        Returns the current sequence number. Cheaper than ``read`` for checking whether anything changed.
+        """
+        return SEQUENCE_FORMAT.unpack_from(self._map, SEQUENCE_OFFSET)[0]
+
+    def read(self) -> dict | None:
+        """
+        Returns a consistent copy of the state.
+
+        Returns:
+            dict | None: The state ("sequence", "layout_id", "caps_lock", "color_prevalence", "last_switch_time",
+            "language"), or None if the app never wrote the block or kept writing during every attempt.
+        """
+        for _ in range(MAX_READ_ATTEMPTS):
+            sequence = SEQUENCE_FORMAT.unpack_from(self._map, SEQUENCE_OFFSET)[0]
+            if sequence & 1:
+                continue  # A write is in progress
+            block = self._map[:SEGMENT_SIZE]
+            if SEQUENCE_FORMAT.unpack_from(self._map, SEQUENCE_OFFSET)[0] != sequence:
+                continue  # The block changed while it was copied
+
+            magic, version, size = HEADER_FORMAT.unpack_from(block, 0)
+            if magic != MAGIC or version != FORMAT_VERSION or sequence == 0:
+                return None
+
+            layout_id, caps_lock, color_prevalence, last_switch_time, language = \
+                PAYLOAD_FORMAT.unpack_from(block, PAYLOAD_OFFSET)
+            return {
+                "sequence": sequence,
+                "layout_id": layout_id,
+                "caps_lock": bool(caps_lock),
+                "color_prevalence": None if color_prevalence < 0 else color_prevalence,
+                "last_switch_time": last_switch_time,
+                "language": language.rstrip(b"\0").decode('utf-8', errors='replace'),
+            }
+        return None
+
+    def close(self) -> None:
+        self._map.close()
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import threading
+
+    # A file backed block, so the example also works where named mappings don't exist
+    example_path = os.path.join(tempfile.gettempdir(), "status-segment-example.bin")
+    writer = StatusSegmentWriter(path=example_path)
+    reader = StatusSegmentReader(path=example_path)
+    writing_done = threading.Event()
+
+    def write_many():
+        for i in range(200000):
+            english = i % 2 == 0
+            writer.publish(0x04090409 if english else 0x040D040D, False, int(not english),
+                           "English" if english else "Hebrew")
+        writing_done.set()
+
+    threading.Thread(target=write_many).start()
+
+    reads = inconsistent = 0
+    start = time.perf_counter()
+    while not writing_done.is_set():
+        state = reader.read()
+        if state is None:
+            continue
+        reads += 1
+        # Every state the writer published matches one of these two
+        if (state["layout_id"], state["color_prevalence"], state["language"]) not in \
+                ((0x04090409, 0, "English"), (0x040D040D, 1, "Hebrew")):
+            inconsistent += 1
+    elapsed = time.perf_counter() - start
+
+    print(f"{reads} reads in {elapsed:.2f}s ({reads / elapsed:,.0f}/s), {inconsistent} inconsistent")
+    print(reader.read())
@@ -0,0 +1,144 @@
+"""
+Created by: Ori Halevi
+GitHub: https://github.com/ori-halevi
+Python 3.12
+
+Description: Keeps the state shown in the tray menu (the preferred language and the check boxes) in memory.
+
+Rendering the menu evaluates the ``checked=`` callback of every item. When those callbacks read the preferences file
+or the registry, every render costs one read per language. With the model, the callbacks only look up a value in
+memory, and the code that changes the state (saving a setting, toggling load on startup) updates the model. The menu
+is rendered again only when a value actually changed. The color sync reads the preferred language and the wallpaper
+setting from the model too, so no file is read on the way to a repaint.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+
+# Condition to toggle to see DEBUG logging
+DEBUG = False
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG if DEBUG else None,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# The state shown in the menu, and its value until the real one is known
+DEFAULT_MENU_STATE = {
+    "preferred_language": None,
+    "load_on_startup": False,
+    "wallpaper_accent_colors": False,
+}
+
+
+class TrayMenuModel:
+    """
+    The state shown in the tray menu. Calls ``on_change`` when it changes.
+    """
+
+    def __init__(self, on_change: callable = None):
+        """
+        Args:
+            on_change (callable): Called with no arguments after any value changed, e.g. ``icon.update_menu``.
+                Can be set later, once the menu exists.
+        """
+        self.on_change = on_change
+        self.updates = 0
+        self.renders = 0
+        self._state = dict(DEFAULT_MENU_STATE)
+        self._lock = threading.Lock()
+
+    def get(self, name: str):
+        """
+        Returns the current value of a state.
+
+        Args:
+            name (str): The name of the state, e.g. "preferred_language".
+        """
+        return self._state[name]
+
+    def is_checked(self, name: str, value=True) -> bool:
+        """
+        Returns True if the state has the given value. Meant for ``checked=`` callbacks.
+
+        Args:
+            name (str): The name of the state.
+            value: The value that checks the item.
+        """
+        return self._state[name] == value
+
+    def update(self, **values) -> bool:
+        """
+        Sets new values, and calls ``on_change`` if any of them is different from the current one.
+        Names that aren't shown in the menu are ignored.
+
+        Args:
+            **values: The new values, by name.
+
+        Returns:
+            bool: True if anything changed.
+        """
+        with self._lock:
+            self.updates += 1
+            changed = [
+                name for name, value in values.items()
+                if name in self._state and self._state[name] != value
+            ]
+            for name in changed:
+                self._state[name] = values[name]
+
+        if not changed:
+            return False
+
+        logging.debug(f"Tray menu state changed: {', '.join(changed)}")
+        if self.on_change is not None:
+            self.renders += 1
+            try:
+                self.on_change()
+            except Exception as e:
+                logging.error(f"Error updating the tray menu: {e}")
+        return True
+
+
+if __name__ == "__main__":
+    import json
+    import os
+    import tempfile
+    import time
+
+    repeats = 200
+
+    with tempfile.TemporaryDirectory() as folder:
+        preferences_file = os.path.join(folder, "user_preferences.json")
+        with open(preferences_file, 'w') as f:
+            json.dump({"preferred_language": "English", "wallpaper_accent_colors": False}, f)
+
+        # The old way: every check box reads the preferences file when the menu is rendered
+        def is_selected_by_file(language):
+            with open(preferences_file, 'r') as f:
+                return json.load(f)["preferred_language"] == language
+
+        model = TrayMenuModel(on_change=lambda: None)
+        model.update(preferred_language="English")
+
+        print(f"{'layouts':>8} {'file reads':>14} {'model':>14}")
+        for layout_count in (2, 10, 50, 200):
+            languages = [f"Language{i}" for i in range(layout_count - 1)] + ["English"]
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                [is_selected_by_file(language) for language in languages]
+            by_file = (time.perf_counter() - start) / repeats
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                [model.is_checked("preferred_language", language) for language in languages]
+            by_model = (time.perf_counter() - start) / repeats
+
+            print(f"{layout_count:>8} {by_file * 1e6:>11.1f} us {by_model * 1e6:>11.1f} us")
+
+    # Selecting the language that is already selected doesn't render the menu again
+    model = TrayMenuModel(on_change=lambda: None)
+    for language in ["English", "English", "Hebrew", "Hebrew", "Hebrew", "English"]:
+        model.update(preferred_language=language)
+    print(f"{model.updates} updates, {model.renders} renders")
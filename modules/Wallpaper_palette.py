@@ -0,0 +1,324 @@
+"""
+Created by: Ori Halevi
+GitHub: https://github.com/ori-halevi
+Python 3.12
+
+Description: Derives taskbar accent colors from the current desktop wallpaper.
+
+The wallpaper is decoded at a reduced size (JPEG files are decoded directly at 1/2, 1/4 or 1/8 of their size),
+downsampled to a small thumbnail, and its pixels are clustered with a vectorized k-means in NumPy. The largest
+cluster is the dominant color, and its opposite on the color wheel is the complementary color.
+
+Extraction takes a noticeable amount of time, so it never happens on a language switch. The palette is cached in
+memory and in the app's LOCALAPPDATA folder, keyed by a hash of the wallpaper path and modification time, and the
+accent color of every language is computed ahead of time, so a switch is a single dictionary lookup.
+"""
+from __future__ import annotations
+
+import colorsys
+import ctypes
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+from modules.Resources import get_app_data_path
+
+# Condition to toggle to see DEBUG logging
+DEBUG = False
+
+# Set up logging
+logging.basicConfig(level=logging.DEBUG if DEBUG else None,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# SystemParametersInfo action that returns the path of the desktop wallpaper
+SPI_GETDESKWALLPAPER = 0x0073
+
+# Size (in pixels) of the longest side of the thumbnail that gets clustered
+THUMBNAIL_SIZE = 128
+
+# Number of colors in the palette and the maximal number of k-means iterations
+PALETTE_SIZE = 5
+KMEANS_ITERATIONS = 12
+
+# Weights for the perceived brightness of a color (ITU-R BT.601)
+LUMINANCE_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# Name of the palette cache file in the app's folder
+CACHE_FILE_NAME = "wallpaper_palette.json"
+
+
+def get_wallpaper_path() -> str | None:
+    """
+    Returns the path of the current desktop wallpaper, or None if there is no wallpaper image.
+    """
+    buffer = ctypes.create_unicode_buffer(260)
+    if not ctypes.windll.user32.SystemParametersInfoW(SPI_GETDESKWALLPAPER, len(buffer), buffer, 0):
+        logging.error("Could not retrieve the wallpaper path.")
+        return None
+    return buffer.value or None
+
+
+def get_wallpaper_key(wallpaper_path: str) -> str:
+    """
+    Returns a hash of the wallpaper path and modification time, which identifies the wallpaper's palette.
+
+    Args:
+        wallpaper_path (str): The path of the wallpaper image.
+    """
+    stat = os.stat(wallpaper_path)
+    return hashlib.sha1(f"{os.path.abspath(wallpaper_path)}|{stat.st_mtime_ns}|{stat.st_size}".encode()).hexdigest()
+
+
+def load_thumbnail_pixels(image_path: str, size: int = THUMBNAIL_SIZE) -> np.ndarray:
+    """
+    Loads an image at a reduced size.
+
+    Args:
+        image_path (str): The path of the image.
+        size (int): The size of the longest side of the thumbnail.
+
+    Returns:
+        np.ndarray: The pixels of the thumbnail as a (N, 3) float32 array.
+    """
+    with Image.open(image_path) as image:
+        # Let the JPEG decoder skip most of the work by decoding at a reduced scale
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+        image.thumbnail((size, size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+        return np.asarray(image, dtype=np.float32).reshape(-1, 3)
+
+
+def cluster_colors(pixels: np.ndarray, count: int = PALETTE_SIZE,
+                   iterations: int = KMEANS_ITERATIONS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Groups pixels into colors with k-means. The starting centers are spread over the brightness range, so the
+    result is the same every time for the same image.
+
+    Args:
+        pixels (np.ndarray): A (N, 3) array of RGB pixels.
+        count (int): The number of colors to find.
+        iterations (int): The maximal number of k-means iterations.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Up to ``count`` distinct colors as a (N, 3) array and the number of pixels
+        in each, sorted from the most common color to the least common. Flat images give fewer colors: empty
+        clusters are dropped and clusters with the same color are merged.
+    """
+    count = min(count, len(pixels))
+    order = np.argsort(pixels @ LUMINANCE_WEIGHTS)
+    centers = pixels[order[np.linspace(0, len(pixels) - 1, count).astype(np.intp)]].copy()
+    pixel_norms = np.einsum('ij,ij->i', pixels, pixels)[:, None]
+
+    for _ in range(iterations):
+        # Squared distances from every pixel to every center: |p|^2 - 2 p.c + |c|^2
+        distances = pixel_norms - 2.0 * (pixels @ centers.T) + np.einsum('ij,ij->i', centers, centers)[None, :]
+        labels = distances.argmin(axis=1)
+
+        sizes = np.bincount(labels, minlength=count)
+        sums = np.stack([np.bincount(labels, weights=pixels[:, channel], minlength=count) for channel in range(3)],
+                        axis=1)
+        # An empty cluster keeps its old center
+        new_centers = np.where(sizes[:, None] > 0, sums / np.maximum(sizes, 1)[:, None], centers).astype(np.float32)
+
+        converged = np.abs(new_centers - centers).max() < 0.5
+        centers = new_centers
+        if converged:
+            break
+
+    sizes = np.bincount(labels, minlength=count)
+
+    # Drop empty clusters and merge the ones that ended up with the same color
+    distinct = {}
+    for center, size in zip(np.clip(np.rint(centers), 0, 255), sizes):
+        if size > 0:
+            color = tuple(int(channel) for channel in center)
+            distinct[color] = distinct.get(color, 0) + int(size)
+    colors = np.array(list(distinct.keys()), dtype=np.float32).reshape(-1, 3)
+    sizes = np.array(list(distinct.values()), dtype=np.intp)
+
+    by_size = np.argsort(-sizes, kind='stable')
+    return colors[by_size], sizes[by_size]
+
+
+def get_complementary_color(rgb: tuple[int, int, int]) -> tuple[int, int, int]:
+    """
+    Returns the color on the opposite side of the color wheel.
+
+    Args:
+        rgb (tuple[int, int, int]): The color.
+    """
+    hue, lightness, saturation = colorsys.rgb_to_hls(*(channel / 255 for channel in rgb))
+    red, green, blue = colorsys.hls_to_rgb((hue + 0.5) % 1.0, lightness, saturation)
+    return round(red * 255), round(green * 255), round(blue * 255)
+
+
+def extract_palette(image_path: str) -> dict:
+    """
+    Extracts the palette of an image.
+
+    Args:
+        image_path (str): The path of the image.
+
+    Returns:
+        dict: "dominant" and "complementary" colors, the "colors" of the palette from the most common to the
+        least common and the share ("weights") of each one.
+    """
+    colors, sizes = cluster_colors(load_thumbnail_pixels(image_path))
+    colors = [tuple(int(channel) for channel in np.clip(np.rint(color), 0, 255)) for color in colors]
+    return {
+        "dominant": colors[0],
+        "complementary": get_complementary_color(colors[0]),
+        "colors": colors,
+        "weights": [round(float(size) / float(sizes.sum()), 4) for size in sizes],
+    }
+
+
+def get_language_accents(languages: list[str], palette: dict) -> dict[str, tuple[int, int, int]]:
+    """
+    Gives every language its own accent color: the complementary color first, then the palette colors. A color is
+    used again only when there are more languages than distinct colors.
+
+    Args:
+        languages (list[str]): The languages, in the order they should get colors.
+        palette (dict): A palette returned by ``extract_palette``.
+
+    Returns:
+        dict[str, tuple[int, int, int]]: The accent color of every language.
+    """
+    # The complementary color of a gray wallpaper is the same gray, and older cached palettes may hold duplicates
+    accents = list(dict.fromkeys([tuple(palette["complementary"])] + [tuple(color) for color in palette["colors"]]))
+    return {language: accents[index % len(accents)] for index, language in enumerate(languages)}
+
+
+class WallpaperAccentColors:
+    """
+    Keeps the accent color of every language, computed ahead of time from the current wallpaper.
+    """
+
+    def __init__(self, languages: list[str], wallpaper_path_query: callable = get_wallpaper_path,
+                 cache_file: str | None = None):
+        """
+        Args:
+            languages (list[str]): The languages that need accent colors.
+            wallpaper_path_query (callable): Returns the path of the current wallpaper.
+            cache_file (str | None): Where to keep the palette between runs. Defaults to the app's folder.
+        """
+        self.languages = list(languages)
+        self.wallpaper_path_query = wallpaper_path_query
+        self.cache_file = cache_file
+        self.wallpaper_key = None
+        self.palette = None
+        self.accents: dict[str, tuple[int, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def _load_cached_palette(self, wallpaper_key: str) -> dict | None:
+        try:
+            with open(self.cache_file or get_app_data_path(CACHE_FILE_NAME), 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get("key") == wallpaper_key:
+                return cached["palette"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def _save_cached_palette(self, wallpaper_key: str, palette: dict) -> None:
+        try:
+            with open(self.cache_file or get_app_data_path(CACHE_FILE_NAME), 'w', encoding='utf-8') as f:
+                json.dump({"key": wallpaper_key, "palette": palette}, f)
+        except OSError as e:
+            logging.error(f"Error saving the wallpaper palette: {e}")
+
+    def refresh(self, *_) -> bool:
+        """
+        Recomputes the accent colors if the wallpaper changed since the last refresh. Accepts (and ignores) the
+        arguments of a language change hook, so it can run on the hook thread pool.
+
+        Returns:
+            bool: True if the accent colors changed.
+        """
+        wallpaper_path = self.wallpaper_path_query()
+        try:
+            wallpaper_key = get_wallpaper_key(wallpaper_path) if wallpaper_path else None
+        except OSError:
+            wallpaper_key = None
+
+        if wallpaper_key is None:
+            with self._lock:
+                changed = bool(self.accents)
+                self.wallpaper_key, self.palette, self.accents = None, None, {}
+            return changed
+
+        if wallpaper_key == self.wallpaper_key:
+            return False
+
+        palette = self._load_cached_palette(wallpaper_key)
+        if palette is None:
+            try:
+                palette = extract_palette(wallpaper_path)
+            except (OSError, ValueError) as e:
+                logging.error(f"Error extracting the wallpaper palette: {e}")
+                return False
+            self._save_cached_palette(wallpaper_key, palette)
+            logging.info(f"Extracted the wallpaper palette of {wallpaper_path}")
+
+        with self._lock:
+            self.wallpaper_key = wallpaper_key
+            self.palette = palette
+            self.accents = get_language_accents(self.languages, palette)
+        return True
+
+    def get_accent(self, language: str) -> tuple[int, int, int] | None:
+        """
+        Returns the accent color of a language. Never touches the wallpaper.
+
+        Args:
+            language (str): The language.
+        """
+        return self.accents.get(language)
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    # Benchmark the extraction on large wallpapers
+    random_generator = np.random.default_rng(0)
+    for name, (width, height) in (("4K", (3840, 2160)), ("8K", (7680, 4320))):
+        # A smooth gradient with some noise, which compresses like a real photo
+        x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        noise = random_generator.normal(0, 12, (height, width)).astype(np.float32)
+        channels = [x + 0 * y + noise, y + 0 * x + noise, (255 - x) * 0.5 + y * 0.5 + noise]
+        pixels = np.clip(np.stack(channels, axis=-1), 0, 255).astype(np.uint8)
+
+        for extension in ("jpg", "png"):
+            path = os.path.join(tempfile.gettempdir(), f"wallpaper-benchmark-{name}.{extension}")
+            Image.fromarray(pixels).save(path)
+
+            start = time.perf_counter()
+            extracted = extract_palette(path)
+            extraction_time = time.perf_counter() - start
+
+            accent_colors = WallpaperAccentColors(["English", "Hebrew", "Arabic"], lambda: path,
+                                                  cache_file=path + ".palette.json")
+            accent_colors.refresh()  # Fills the cache
+            start = time.perf_counter()
+            for _ in range(10000):
+                accent_colors.get_accent("Hebrew")
+            lookup_time = (time.perf_counter() - start) / 10000
+
+            print(f"{name} {extension}: extraction {extraction_time * 1000:.1f} ms, "
+                  f"switch lookup {lookup_time * 1e9:.0f} ns, dominant {extracted['dominant']}")
+
+    # A flat wallpaper has one color, so the languages don't all get copies of it
+    flat_path = os.path.join(tempfile.gettempdir(), "wallpaper-benchmark-flat.png")
+    Image.new('RGB', (640, 360), (200, 0, 0)).save(flat_path)
+    flat_palette = extract_palette(flat_path)
+    assert flat_palette["colors"] == [(200, 0, 0)] and flat_palette["weights"] == [1.0], flat_palette
+    flat_accents = get_language_accents(["English", "Hebrew"], flat_palette)
+    assert flat_accents["English"] != flat_accents["Hebrew"], flat_accents
+    print(f"flat: {flat_accents}")
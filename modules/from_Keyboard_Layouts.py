@@ -1,5 +1,6 @@
 import winreg
 import logging
+from modules.Registry_cache import registry_cache
 
 # Condition to toggle to see DEBUG logging
 DEBUG = False
@@ -18,17 +19,9 @@ def read_keyboard_layouts() -> list[str]:
     layouts = []
 
     try:
-        # Open the registry key for keyboard layouts
-        with winreg.OpenKey(winreg.HKEY_CURRENT_USER, r'Keyboard Layout\Preload') as reg_key:
-            i = 0
-            while True:
-                try:
-                    # Get the value of the layout identifier
-                    layout_value = winreg.EnumValue(reg_key, i)
-                    layouts.append(layout_value[1])  # The identifier is in the first position of the value
-                    i += 1
-                except OSError:
-                    break  # Exit when there are no more values
+        # Read all the values of the keyboard layouts key
+        for layout_value in registry_cache.enum_values(winreg.HKEY_CURRENT_USER, r'Keyboard Layout\Preload'):
+            layouts.append(layout_value[1])  # The identifier is in the first position of the value
 
     except Exception as e:
         logging.error(f"Error reading keyboard layouts: {e}")
@@ -47,11 +40,11 @@ def get_layout_text(layout_id: str) -> str | None:
         str or None: The layout text if found, otherwise None.
     """
     try:
-        # Open the registry key for the keyboard layout
-        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, rf'SYSTEM\CurrentControlSet\Control\Keyboard Layouts\{layout_id}') as reg_key:
-            # Get the value of "Layout Text"
-            layout_text = winreg.QueryValueEx(reg_key, "Layout Text")[0]
-            return layout_text
+        # Get the value of "Layout Text" from the registry key of the keyboard layout
+        layout_text = registry_cache.query_value(winreg.HKEY_LOCAL_MACHINE,
+                                                 rf'SYSTEM\CurrentControlSet\Control\Keyboard Layouts\{layout_id}',
+                                                 "Layout Text")[0]
+        return layout_text
     except FileNotFoundError:
         logging.warning(f"Layout ID {layout_id} not found in registry.")
         return None  # The key does not exist
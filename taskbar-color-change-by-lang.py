@@ -14,6 +14,7 @@ inside the key:
 """
 
 import os
+import argparse
 import shutil
 import json
 import sys
@@ -25,13 +26,26 @@ import time
 import winreg
 import logging
 import threading
+from datetime import datetime
 from PIL import Image, ImageDraw
-from pathlib import Path
 from pystray import MenuItem as item, Menu, Icon
 from modules.Find_out_installd_keyboard_layout import get_all_system_keyboard_layouts
 from modules.Load_on_startup import *
 from modules.Language_change_monitor import *
 from modules.StartAndTaskbarColorManager import StartAndTaskbarColorManager
+from modules.Foreground_change_monitor import ForegroundChangeMonitor
+from modules.Language_change_hooks import (discover_entry_point_hooks, get_hook_metrics, register_hook, run_hooks,
+                                          shutdown_hooks)
+from modules.Wallpaper_palette import WallpaperAccentColors
+from modules.Single_instance import SingleInstanceGuard
+from modules.Registry_cache import registry_cache
+from modules.Status_segment import StatusSegmentWriter, DEFAULT_SEGMENT_NAME
+from modules.Resources import get_app_data_path, load_tray_icon
+from modules.Resource_accounting import get_resource_report, run_soak_test
+from modules.Sampling_profiler import start_profiling_session, DEFAULT_PROFILE_DURATION
+from modules.Coalescing_worker import CoalescingWorker
+from modules.Color_scheduler import ColorScheduler, get_active_schedule, parse_schedules
+from modules.Tray_menu_model import TrayMenuModel
 
 # Version of this release
 __version__ = 'v2.1.1'
@@ -43,6 +57,24 @@ DEBUG = False
 logging.basicConfig(level=logging.DEBUG if DEBUG else None,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+# The language the taskbar color was last synchronized with
+last_language = None
+
+# Makes sure two events never decide and toggle the color at the same time
+color_sync_lock = threading.Lock()
+
+# The state shown in the tray menu, kept in memory so rendering the menu reads no files
+tray_menu_model = TrayMenuModel()
+
+# The valid time-of-day schedules, kept in memory so the sync reads no files
+current_schedules = []
+
+# Wakes the color sync up when a time-of-day schedule starts or ends (None until the app starts it)
+color_scheduler = None
+
+# Milliseconds from launch until the tray icon was ready (None until then), shown in the diagnostics
+startup_milliseconds = None
+
 
 #
 # Section for local simple functions:
@@ -53,6 +85,69 @@ def get_current_app_path():
     return app_path
 
 
+def parse_command_line(arguments: list[str] | None = None) -> argparse.Namespace:
+    """
+    Parses the command line options of the app. Unknown options are ignored.
+
+    Args:
+        arguments (list[str] | None): The arguments to parse, or None for sys.argv.
+    """
+    parser = argparse.ArgumentParser(description="Changes the taskbar color when the keyboard language changes.")
+    parser.add_argument('--profile', type=float, metavar='SECONDS',
+                        help="Profile the app for SECONDS seconds (from the start, or now if it is already running) "
+                             "and save the result in LOCALAPPDATA.")
+
+    # Actions that are forwarded to the copy that is already running
+    actions = parser.add_mutually_exclusive_group()
+    actions.add_argument('--toggle', action='store_const', dest='command', const='toggle',
+                         help="Toggle the taskbar color (temporary).")
+    actions.add_argument('--set-preference', metavar='LANGUAGE',
+                         help="Set the preferred language (the one without taskbar color).")
+    actions.add_argument('--quit', action='store_const', dest='command', const='quit',
+                         help="Quit the running copy.")
+    actions.add_argument('--status', action='store_const', dest='command', const='status',
+                         help="Print the state of the running copy.")
+    actions.add_argument('--diagnostics', action='store_const', dest='command', const='diagnostics',
+                         help="Print the resource counts and metrics of the running copy.")
+
+    parser.add_argument('--soak', type=int, metavar='SWITCHES',
+                        help="Replay SWITCHES simulated language switches and fail if any resource count grows.")
+    parsed_arguments = parser.parse_known_args(arguments)[0]
+    if parsed_arguments.set_preference:
+        parsed_arguments.command = 'set-preference'
+    return parsed_arguments
+
+
+def forward_command_to_running_instance(arguments: argparse.Namespace) -> int:
+    """
+    Hands the command line action to the copy of the app that is already running.
+
+    Args:
+        arguments (argparse.Namespace): The parsed command line.
+
+    Returns:
+        int: The exit code for this copy.
+    """
+    commands = []
+    if arguments.profile:
+        commands.append(('profile', arguments.profile))
+    if arguments.command is not None:
+        commands.append((arguments.command, arguments.set_preference))
+    if not commands:
+        logging.info("The app is already running.")
+        return 0
+
+    exit_code = 0
+    for command, argument in commands:
+        reply = instance_guard.send_command(command, argument)
+        if reply is None:
+            return 1
+        print(json.dumps(reply.get("result") if reply.get("ok") else reply, ensure_ascii=False))
+        if not reply.get("ok"):
+            exit_code = 1
+    return exit_code
+
+
 def show_update_notification(icon, latest_version):
     """
     Shows a popup notification in the tray icon if a new version is available.
@@ -64,16 +159,115 @@ def show_update_notification(icon, latest_version):
     icon.notify(f"A new and better version is available: {latest_version}!", title="Update Available")
 
 
-def sync_taskbar_color_with_preference_lang():
+def sync_taskbar_color_with_preference_lang(layout: int | None = None):
     """
     Synchronize the taskbar color with the preferred lang.
+
+    This is the one decision path for everything that may change the color: registry language switches,
+    foreground window changes, CapsLock, preference changes and schedule boundaries. It only toggles the color
+    when it is wrong, so it is safe to call for events that didn't change anything. The language change hooks run
+    afterward. Events should call ``request_color_sync`` rather than this, so bursts of them are merged.
+
+    Args:
+        layout (int | None): The current keyboard layout (HKL), or None to read it from the foreground window.
     """
-    if load_user_preferences() == get_current_language().split()[0] and taskbar_manager.get_color_prevalence_status():
+    with color_sync_lock:
+        _sync_taskbar_color(layout)
+
+
+def _sync_taskbar_color(layout: int | None):
+    global last_language
+    if layout is None:
+        layout = get_current_layout()
+    language = get_language_name(layout & 0xFFFF)  # The low-order word is the language ID
+    color_prevalence = taskbar_manager.get_color_prevalence_status()
+    if language is None or color_prevalence is None:
+        return
+
+    # While CapsLock is on the user types in English, so it counts as the English layout
+    effective_language = "English" if is_caps_lock_on() else language.split()[0]
+    wants_color = tray_menu_model.get("preferred_language") != effective_language
+
+    # An active time-of-day schedule is layered on top of the per-language choice
+    schedule = get_active_schedule(current_schedules, datetime.now())
+    if schedule is not None and schedule["color_prevalence"] is not None:
+        wants_color = bool(schedule["color_prevalence"])
+
+    color_changed = bool(color_prevalence) != wants_color
+
+    # Use the accent color of the schedule, or the one of this language that was computed ahead of time from the
+    # wallpaper
+    accent_color = None
+    if schedule is not None and schedule["accent_color"] is not None:
+        accent_color = schedule["accent_color"]
+    elif tray_menu_model.get("wallpaper_accent_colors"):
+        accent_color = wallpaper_accents.get_accent(language.split()[0])
+    # The toggle below refreshes the taskbar anyway, so refresh here only if there is no toggle
+    if accent_color is not None:
+        taskbar_manager.set_accent_color(accent_color, refresh=not color_changed)
+    else:
+        # No schedule or wallpaper accent applies (any more): give the user's own accent color back
+        taskbar_manager.restore_accent_color(refresh=not color_changed)
+
+    if color_changed:
         taskbar_manager.toggle_color_prevalence()
         logging.info("taskbar color changed!")
-    elif load_user_preferences() != get_current_language().split()[0] and not taskbar_manager.get_color_prevalence_status():
+
+    color_prevalence = taskbar_manager.get_color_prevalence_status()
+    status_segment.publish(layout, is_caps_lock_on(), color_prevalence, language)
+    refresh_load_on_startup()
+
+    if color_changed or language != last_language:
+        last_language = language
+        run_hooks(language, color_prevalence)
+
+
+def request_color_sync(layout: int | None = None):
+    """
+    Asks the color sync worker for a sync and returns at once. Requests that arrive while a sync is running are
+    merged into one more sync, with the latest layout.
+
+    Args:
+        layout (int | None): The current keyboard layout (HKL), or None to read it from the foreground window.
+    """
+    color_sync_worker.request(layout)
+
+
+def toggle_taskbar_color_temporarily():
+    """
+    Toggles the taskbar color until the next event that syncs it, and publishes the new state.
+    """
+    with color_sync_lock:
         taskbar_manager.toggle_color_prevalence()
-        logging.info("taskbar color changed!")
+        layout = get_current_layout()
+        status_segment.publish(layout, is_caps_lock_on(), taskbar_manager.get_color_prevalence_status(),
+                               get_language_name(layout & 0xFFFF))
+
+
+def get_diagnostics() -> dict:
+    """
+    Collects the resource counts and metrics of the app.
+    """
+    return {
+        "version": __version__,
+        "startup_ms": startup_milliseconds,
+        "resources": get_resource_report(),
+        "registry_cache": registry_cache.get_stats(),
+        "hooks": get_hook_metrics(),
+    }
+
+
+def save_diagnostics() -> str:
+    """
+    Saves the diagnostics in the app's LOCALAPPDATA folder.
+
+    Returns:
+        str: The path of the saved file.
+    """
+    diagnostics_file = get_app_data_path("diagnostics.json")
+    with open(diagnostics_file, 'w') as f:
+        json.dump(get_diagnostics(), f, indent=2)
+    return diagnostics_file
 
 
 def check_for_updates(current_version):
@@ -104,10 +298,7 @@ def open_git_releases():
 #
 # This section is responsible for monitoring the user's preferred language:
 def get_preferences_file():
-    appdata_path = os.getenv('LOCALAPPDATA')  # מקבל את הנתיב לתיקיית AppData המקומית
-    app_folder = os.path.join(appdata_path, "taskbar-color-change-by-lang")
-    os.makedirs(app_folder, exist_ok=True)  # יוצר את התיקייה אם היא לא קיימת
-    return os.path.join(app_folder, "user_preferences.json")
+    return get_app_data_path("user_preferences.json")  # In the app's LOCALAPPDATA folder
 
 
 def load_user_preferences():
@@ -124,11 +315,111 @@ def load_user_preferences():
 
 
 def save_user_preferences(preferred_language):
-    preferences = {"preferred_language": preferred_language}
+    save_user_setting("preferred_language", preferred_language)
+
+
+def load_user_setting(name, default=None):
+    """
+    Reads a single setting from the preferences file.
+
+    Args:
+        name: The name of the setting.
+        default: The value to return if the setting was never saved.
+    """
+    try:
+        with open(get_preferences_file(), 'r') as f:
+            return json.load(f).get(name, default)
+    except (OSError, ValueError, AttributeError):
+        return default
+
+
+def load_schedules():
+    """
+    Reads the valid time-of-day schedules from the preferences file (see modules/Color_scheduler.py) and keeps
+    them in memory for the sync. The scheduler calls it whenever it computes the next boundary.
+    """
+    global current_schedules
+    current_schedules = parse_schedules(load_user_setting("schedules", []))
+    return current_schedules
+
+
+def load_settings():
+    """
+    Reads the settings the sync and the tray menu use into memory, once. From now on they are updated where they
+    change.
+    """
+    tray_menu_model.update(preferred_language=load_user_preferences(),
+                           wallpaper_accent_colors=load_user_setting("wallpaper_accent_colors", False))
+    refresh_load_on_startup()
+    load_schedules()
+
+
+def refresh_load_on_startup():
+    """
+    Shows in the tray menu whether the app loads on startup. The Run key can be changed outside the app (e.g. in
+    Task Manager), so this is called on every sync; the read is served from the registry cache, and goes to the
+    registry only after the key changed.
+    """
+    tray_menu_model.update(load_on_startup=is_load_on_startup(get_current_app_path()))
+
+
+def save_user_setting(name, value):
+    """
+    Saves a single setting in the preferences file, keeping all the other settings.
+
+    Args:
+        name: The name of the setting.
+        value: The value to save (must be JSON serializable).
+    """
     preferences_file = get_preferences_file()
+    try:
+        with open(preferences_file, 'r') as f:
+            preferences = json.load(f)
+        if not isinstance(preferences, dict):
+            preferences = {}
+    except (OSError, ValueError):
+        preferences = {}
+    preferences[name] = value
     with open(preferences_file, 'w') as f:
         json.dump(preferences, f)
 
+    # Show the new value in the tray menu (the menu is rendered again only if it changed)
+    tray_menu_model.update(**{name: value})
+
+    if name == "schedules":
+        load_schedules()
+        if color_scheduler is not None:
+            color_scheduler.reschedule()  # Applies a schedule that is running now, and finds the next boundary
+
+
+def refresh_wallpaper_accents(*_):
+    """
+    Recomputes the accent colors if the wallpaper changed, and applies them. Runs as a language change hook, so
+    the wallpaper is never read on the way to a taskbar repaint.
+    """
+    if tray_menu_model.get("wallpaper_accent_colors") and wallpaper_accents.refresh():
+        request_color_sync()
+
+
+def quit_application(icon):
+    """
+    Quits the application: stops all threads and the tray icon.
+
+    Args:
+        icon: The tray icon instance.
+    """
+    stop_event.set()  # Signal all threads to stop
+    logging.info("Exiting application.")
+    color_scheduler.stop()  # Stop the schedule timer
+    color_sync_worker.stop()  # Stop the color sync worker
+    with color_sync_lock:
+        taskbar_manager.restore_accent_color()  # Give the user's own accent color back
+    shutdown_hooks()  # Stop the language change hooks
+    icon.stop()  # Stop the tray icon
+    instance_guard.release()  # Let a new copy start
+    time.sleep(2)  # Short delay before exit
+    os._exit(0)
+
 
 #
 #
@@ -145,17 +436,6 @@ def setup_tray_icon() -> 'Icon':
         Icon: The created system tray icon.
     """
 
-    def quit_application():
-        """
-        Callback to quit the application when the tray icon is clicked.
-        """
-        stop_event.set()  # Signal all threads to stop
-        logging.info("Exiting application.")
-        kernel32.CloseHandle(taskbar_manager.taskbar_handle)  # Close the taskbar handle
-        icon.stop()  # Stop the tray icon
-        time.sleep(2)  # Short delay before exit
-        os._exit(0)
-
     def generate_icon_image(width, height, top_color, bottom_color):
         """
         Creates an image for the tray icon.
@@ -180,14 +460,11 @@ def setup_tray_icon() -> 'Icon':
             icon_object: The tray icon object.
             selected_menu_item: The selected menu item.
         """
-        # Save the user's preference for the selected item
+        # Save the user's preference for the selected item (this also updates the menu)
         save_user_preferences(str(selected_menu_item))
 
-        # Refresh the menu to display changes
-        icon_object.update_menu()
-
         # Sync the taskbar color with the selected language preference
-        sync_taskbar_color_with_preference_lang()
+        request_color_sync()
 
     def is_currently_selected(menu_item) -> bool:
         """
@@ -199,7 +476,7 @@ def setup_tray_icon() -> 'Icon':
         Returns:
             bool: True if the menu item is selected, False otherwise.
         """
-        return menu_item.text == str(load_user_preferences())
+        return tray_menu_model.is_checked("preferred_language", menu_item.text)
 
     def create_language_sub_menu() -> 'Menu':
         """
@@ -222,6 +499,39 @@ def setup_tray_icon() -> 'Icon':
         # Return a menu with the items
         return Menu(*menu_items)
 
+    def profile_application(icon_object):
+        """
+        Starts a profiling session and notifies the user where the result was saved when it ends.
+        """
+        def on_profile_saved(pstats_path):
+            icon_object.notify(f"The profile was saved to {pstats_path}", title="Profiling Finished")
+
+        if start_profiling_session(DEFAULT_PROFILE_DURATION, on_finished=on_profile_saved):
+            icon_object.notify(f"Profiling for {DEFAULT_PROFILE_DURATION} seconds...", title="Profiling Started")
+
+    def toggle_wallpaper_colors(icon_object):
+        """
+        Toggles whether the accent color of every language is taken from the wallpaper.
+        """
+        enabled = not tray_menu_model.get("wallpaper_accent_colors")
+        save_user_setting("wallpaper_accent_colors", enabled)
+
+        if enabled:
+            def apply_wallpaper_colors():
+                wallpaper_accents.refresh()
+                request_color_sync()
+
+            threading.Thread(target=apply_wallpaper_colors, name="wallpaper-palette").start()
+        else:
+            # The sync gives the user's own accent color back (unless a schedule sets one)
+            request_color_sync()
+
+    def show_diagnostics(icon_object):
+        """
+        Saves the diagnostics and tells the user where.
+        """
+        icon_object.notify(f"Diagnostics saved to {save_diagnostics()}", title="Diagnostics")
+
     def toggle_startup_on_boot(icon_object):
         """
         Toggles whether the application should load on startup.
@@ -232,7 +542,7 @@ def setup_tray_icon() -> 'Icon':
         else:
             load_on_startup(app_path)
         # Refresh the menu to display changes
-        icon_object.update_menu()
+        refresh_load_on_startup()
 
     def is_startup_on_boot_enabled(_) -> bool:
         """
@@ -241,23 +551,26 @@ def setup_tray_icon() -> 'Icon':
         Returns:
             bool: True if set to load on startup, False otherwise.
         """
-        app_path = get_current_app_path()
-        return is_load_on_startup(app_path)
+        return tray_menu_model.is_checked("load_on_startup")
 
     # Create the main menu with an item that leads to the sub-menu
     menu = Menu(
         item('Load on Startup', toggle_startup_on_boot, checked=is_startup_on_boot_enabled),  # Load on startup option
         item('━ ━━ ━━━ ━━━━ ━━━━━ ━━━━━━ ━━━━', lambda: None),  # A fake separator
         item('Change Preferred Language', create_language_sub_menu()),  # Language menu
-        item('Toggle Taskbar Color (Temporary)', lambda: taskbar_manager.toggle_color_prevalence()),    # Taskbar color toggle
+        # Accent colors from the wallpaper
+        item('Use Wallpaper Colors', toggle_wallpaper_colors,
+             checked=lambda _: tray_menu_model.is_checked("wallpaper_accent_colors")),
+        item('Toggle Taskbar Color (Temporary)', lambda: toggle_taskbar_color_temporarily()),    # Taskbar color toggle
         item('Check for Updates', lambda: open_git_releases()),  # Option to check for updates
-        item('Quit', lambda: quit_application())  # Option to quit the application
+        item(f'Profile for {DEFAULT_PROFILE_DURATION} Seconds', profile_application),  # Capture what the app is doing
+        item('Save Diagnostics', show_diagnostics),  # Resource counts and metrics
+        item('Quit', lambda: quit_application(icon))  # Option to quit the application
     )
 
     try:
-        # Attempt to load an existing icon image
-        icon_path = Path(__file__).resolve().parent / 'windows-11-change-taskbar-color.png'
-        icon_image = Image.open(icon_path)
+        # Load the bundled icon image (straight from the bundle, decoded once)
+        icon_image = load_tray_icon()
     except FileNotFoundError:
         # Create a default icon if the file is not found
         icon_image = generate_icon_image(64, 64, 'purple', 'lightblue')
@@ -265,8 +578,11 @@ def setup_tray_icon() -> 'Icon':
     # Create the tray icon (must provide some image for the icon)
     icon = Icon("Language Toggle", icon_image, "Language Toggle", menu)
 
+    # Render the menu again whenever the state shown in it changes
+    tray_menu_model.on_change = icon.update_menu
+
     # Start the tray icon in a separate thread
-    threading.Thread(target=icon.run, daemon=True).start()
+    threading.Thread(target=icon.run, name="tray-icon", daemon=True).start()
 
     return icon
 
@@ -287,19 +603,12 @@ def on_press(key):
     try:
         if key == keyboard.Key.caps_lock:
             # Check the actual state of CapsLock
-            caps_state = is_caps_lock_on()
-            if caps_state:
+            if is_caps_lock_on():
                 logging.info("CapsLock is ON.")
-                # if the user prefer that on English will there not be color and now there is
-                if load_user_preferences() == "English" and taskbar_manager.get_color_prevalence_status():
-                    taskbar_manager.toggle_color_prevalence()
-                # if the user prefer that on English will there be color and now there is not
-                elif load_user_preferences() != "English" and not taskbar_manager.get_color_prevalence_status():
-                    taskbar_manager.toggle_color_prevalence()
-
             else:
                 logging.info("CapsLock is OFF")
-                sync_taskbar_color_with_preference_lang()
+            # The decision path treats CapsLock as the English layout
+            request_color_sync()
 
     except AttributeError:
         pass
@@ -311,30 +620,132 @@ def listen_to_caps_lock():
         listener.join()
 
 
+#
+# This section is responsible for the soak test mode:
+
+class SimulatedTaskbarManager(StartAndTaskbarColorManager):
+    """
+    Keeps ColorPrevalence in memory, so the soak test never changes the real taskbar.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.color_prevalence = 0
+
+    def toggle_color_prevalence(self) -> None:
+        self.color_prevalence = 0 if self.color_prevalence == 1 else 1
+
+    def get_color_prevalence_status(self) -> int | None:
+        return self.color_prevalence
+
+    def set_accent_color(self, rgb, refresh: bool = True) -> bool:
+        return False
+
+    def restore_accent_color(self, refresh: bool = True) -> bool:
+        return False
+
+
+def run_soak_mode(switches: int) -> int:
+    """
+    Replays simulated language switches through the same code paths as real ones, and checks that no
+    resource count grows.
+
+    Args:
+        switches (int): The number of switches to replay.
+
+    Returns:
+        int: The exit code: 0 if no count grew, 1 otherwise.
+    """
+    simulated_layouts = (0x04090409, 0x040D040D)  # English, Hebrew
+    # Installed plugins drive real devices and services, so they are not loaded; a hook that does nothing keeps
+    # the hook pool in the test
+    register_hook("soak-no-op", lambda language, color_prevalence: None)
+
+    def simulate_switch(i):
+        # A registry watch that times out at once opens and closes the same handles as a real switch
+        start_monitor_language_in_registry_key(0)
+        request_color_sync(simulated_layouts[i % 2])
+        color_sync_worker.wait_until_idle()
+        # What toggling "Load on Startup" reads to update the tray menu (the sync reads it too)
+        refresh_load_on_startup()
+
+    passed, growth = run_soak_test(simulate_switch, switches)
+    print(json.dumps({"passed": passed, "growth": growth, "diagnostics": get_diagnostics()}, indent=2))
+    return 0 if passed else 1
+
+
 #
 #
 #
 # This is the main function that starts the magic:
-def main():
+def main(arguments: argparse.Namespace):
+    global startup_milliseconds
+
+    if arguments.profile:
+        # Profile from the very start, so the startup is covered too
+        start_profiling_session(arguments.profile)
 
     sync_taskbar_color_with_preference_lang()
+    color_sync_worker.start()
 
     tray_icon = setup_tray_icon()  # Set up the system tray icon
+    startup_milliseconds = round((time.perf_counter() - startup_start_time) * 1000)
+    logging.info(f"Started in {startup_milliseconds} ms.")  # Also in the diagnostics (--diagnostics)
+
+    def handle_remote_command(command, argument):
+        """
+        Runs a command that another copy of the app forwarded to this one.
+        """
+        if command == 'toggle':
+            toggle_taskbar_color_temporarily()
+        elif command == 'set-preference':
+            save_user_preferences(str(argument))
+            request_color_sync()
+        elif command == 'quit':
+            threading.Thread(target=quit_application, args=(tray_icon,), name="quit").start()
+            return "quitting"
+        elif command == 'diagnostics':
+            return get_diagnostics()
+        elif command == 'profile':
+            seconds = float(argument or DEFAULT_PROFILE_DURATION)
+            output = start_profiling_session(seconds, on_finished=lambda pstats_path: tray_icon.notify(
+                f"The profile was saved to {pstats_path}", title="Profiling Finished"))
+            return {"profiling": output is not None, "seconds": seconds, "output": output}
+        return {
+            "version": __version__,
+            "language": last_language,
+            "preferred_language": load_user_preferences(),
+            "color_prevalence": taskbar_manager.get_color_prevalence_status(),
+            "registry_cache": registry_cache.get_stats(),
+        }
+
+    # From now on, other copies of the app hand their commands to this one
+    instance_guard.serve(handle_remote_command)
 
     # Check for updates when the program starts
     latest_version = check_for_updates(__version__)
     if latest_version:
         show_update_notification(tray_icon, latest_version)
 
-    threading.Thread(target=listen_to_caps_lock).start()
+    threading.Thread(target=listen_to_caps_lock, name="caps-lock-listener").start()
+
+    # Load the extra actions that installed plugins want to run on every language change
+    discover_entry_point_hooks()
+
+    # Keep the wallpaper accent colors up to date, off the repaint path
+    register_hook("wallpaper-palette", refresh_wallpaper_accents, timeout=5)
+    threading.Thread(target=refresh_wallpaper_accents, name="wallpaper-palette", daemon=True).start()
+
+    # The foreground window's thread may use another layout without any change in the registry
+    foreground_monitor = ForegroundChangeMonitor(request_color_sync)
+    threading.Thread(target=foreground_monitor.run, args=(stop_event,), name="foreground-monitor", daemon=True).start()
 
     def main_toggle_taskbar_color_condition():
-        if not is_caps_lock_on():
-            threading.Thread(target=taskbar_manager.toggle_color_prevalence).start()  # Toggle color on taskbar in a separate thread
-        elif is_caps_lock_on():
-            if load_user_preferences() == "English" and taskbar_manager.get_color_prevalence_status():
-                # if the user prefers that in English there will be no color and now there is
-                threading.Thread(target=taskbar_manager.toggle_color_prevalence).start()  # Toggle color in a separate thread
+        # The language was switched inside the foreground window, so its cached layout is outdated
+        request_color_sync(foreground_monitor.refresh())
+
+    # A single timer that wakes up only when a time-of-day schedule starts or ends
+    threading.Thread(target=color_scheduler.run, args=(stop_event,), name="color-scheduler", daemon=True).start()
 
     while not stop_event.is_set():
         start_monitor_language_in_registry_key(-1, main_toggle_taskbar_color_condition)
@@ -342,11 +753,54 @@ def main():
 
 if __name__ == "__main__":
 
+    # Measure how long it takes until the tray icon is up
+    startup_start_time = time.perf_counter()
+
+    command_line_arguments = parse_command_line()
+
+    if command_line_arguments.soak:
+        # Nothing real is changed and nothing is shared with a running copy
+        taskbar_manager = SimulatedTaskbarManager()
+        status_segment = StatusSegmentWriter(DEFAULT_SEGMENT_NAME + "-soak")
+        wallpaper_accents = WallpaperAccentColors([])
+        color_sync_worker = CoalescingWorker(sync_taskbar_color_with_preference_lang, name="color-sync")
+        color_sync_worker.start()
+        load_settings()
+        sys.exit(run_soak_mode(command_line_arguments.soak))
+
+    # Only one copy may run - two copies would toggle the color twice on every switch
+    instance_guard = SingleInstanceGuard()
+    if not instance_guard.acquire():
+        sys.exit(forward_command_to_running_instance(command_line_arguments))
+
+    if command_line_arguments.command in ('quit', 'status', 'diagnostics'):
+        instance_guard.release()
+        logging.info("The app is not running.")
+        sys.exit(1)
+    if command_line_arguments.command == 'set-preference':
+        save_user_preferences(command_line_arguments.set_preference)
+
+    # Shared memory block where status bar widgets and scripts can read the state of the app
+    status_segment = StatusSegmentWriter()
+
     # Global stop event to control the monitoring thread
     stop_event = threading.Event()
 
     # Building an object of StartAndTaskbarColorManager
     taskbar_manager = StartAndTaskbarColorManager()  # Initialize the taskbar manager
 
+    # The accent colors of the installed languages, taken from the wallpaper (used only if the user enables them)
+    wallpaper_accents = WallpaperAccentColors(
+        list(dict.fromkeys(layout.split()[0] for layout in get_all_system_keyboard_layouts())))
+
+    # The single thread that syncs the taskbar color, merging events that arrive while it is busy
+    color_sync_worker = CoalescingWorker(sync_taskbar_color_with_preference_lang, name="color-sync")
+
+    # Wakes the color sync up when a time-of-day schedule starts or ends
+    color_scheduler = ColorScheduler(load_schedules, request_color_sync)
+
+    # Read the settings once, so neither the sync nor the tray menu reads files
+    load_settings()
+
     # Start the engine
-    main()
+    main(command_line_arguments)